@@ -0,0 +1,81 @@
+import functools
+import threading
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+
+from pymongo import monitoring
+from pyrogram import enums
+
+from namespaces import current_namespace
+
+# Per-group, per-hour activity counters, flushed to MongoDB as $inc upserts
+_lock = threading.Lock()
+_buckets = defaultdict(Counter)  # (namespace, chat_id, hour) -> counts
+
+# Group whose update is being handled, so DB and API calls can be charged to it
+current_chat = ContextVar("analytics_chat", default=None)
+
+GROUP_TYPES = (enums.ChatType.GROUP, enums.ChatType.SUPERGROUP)
+
+
+def _hour(now: datetime = None) -> datetime:
+    # UTC, since the TTL index on `hour` expires documents by UTC time
+    return (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+def record(chat_id: int, **counts):
+    key = (current_namespace.get(), chat_id, _hour())
+    with _lock:
+        _buckets[key].update(counts)
+
+
+def record_current(**counts):
+    """Add `counts` to the group being handled, if any"""
+    chat_id = current_chat.get()
+    if chat_id is not None:
+        record(chat_id, **counts)
+
+
+def take(namespace: str = None) -> dict:
+    """Remove and return one bot's counters since its last flush, by (chat_id, hour)"""
+    if namespace is None:
+        namespace = current_namespace.get()
+    with _lock:
+        keys = [key for key in _buckets if key[0] == namespace]
+        return {key[1:]: _buckets.pop(key) for key in keys}
+
+
+def restore(buckets: dict, namespace: str = None):
+    """Put back counters from a flush that failed"""
+    if namespace is None:
+        namespace = current_namespace.get()
+    with _lock:
+        for key, counts in buckets.items():
+            _buckets[(namespace, *key)].update(counts)
+
+
+def track_chat(handler):
+    """Charge work done by `handler` to the group the update came from"""
+    @functools.wraps(handler)
+    async def wrapper(client, update):
+        chat = getattr(update, "chat", None) or getattr(getattr(update, "message", None), "chat", None)
+        token = current_chat.set(chat.id if chat and chat.type in GROUP_TYPES else None)
+        try:
+            return await handler(client, update)
+        finally:
+            current_chat.reset(token)
+    return wrapper
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands; Motor copies the caller's context to its threads"""
+
+    def started(self, event):
+        record_current(db_ops=1)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
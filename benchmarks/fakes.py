@@ -0,0 +1,344 @@
+"""In-memory stand-ins for Motor collections and the Pyrogram client.
+
+Only the subset of each API that the bot actually calls is implemented.
+Every call is counted so the runner can report DB ops and API calls per
+message, and an optional fixed latency can be injected to mimic the
+network round trip.
+"""
+
+import asyncio
+import copy
+import itertools
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+from pyrogram import enums
+from pyrogram.errors import PeerIdInvalid
+from pyrogram.types import Chat, Message, Photo, User
+
+
+def _get(doc: dict, key: str):
+    value = doc
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _compare(value, op: str, arg) -> bool:
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$ne":
+        return value != arg
+    if op == "$exists":
+        return (value is not None) == bool(arg)
+    if value is None:
+        return False
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    raise NotImplementedError(f"Unsupported operator: {op}")
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if not all(_compare(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+    else:
+        result = {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+    if projection.get("_id", 1) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    else:
+        result.pop("_id", None)
+    return result
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        self._docs.sort(key=lambda d: (_get(d, key) is None, _get(d, key)), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Dict-backed collection speaking the Motor calls used by `database`"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, stats: Counter, latency: float = 0.0):
+        self.name = name
+        self.docs = {}
+        self.stats = stats
+        self.latency = latency
+
+    async def _op(self, kind: str):
+        self.stats[f"{self.name}.{kind}"] += 1
+        self.stats["db_ops"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _find(self, query):
+        return [doc for doc in self.docs.values() if matches(doc, query or {})]
+
+    def _insert(self, doc):
+        doc = dict(doc)
+        doc.setdefault("_id", next(self._ids))
+        self.docs[doc["_id"]] = doc
+        return doc["_id"]
+
+    def _apply(self, query, update, upsert):
+        found = self._find(query)
+        if found:
+            doc = found[0]
+            for key, value in update.get("$set", {}).items():
+                doc[key] = value
+            for key, value in update.get("$inc", {}).items():
+                doc[key] = doc.get(key, 0) + value
+            for key in update.get("$unset", {}):
+                doc.pop(key, None)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        doc.update(update.get("$setOnInsert", {}))
+        doc.update(update.get("$set", {}))
+        doc.update(update.get("$inc", {}))
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(doc))
+
+    async def find_one(self, query=None, projection=None, **kwargs):
+        await self._op("find_one")
+        found = self._find(query)
+        return project(found[0], projection) if found else None
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.stats[f"{self.name}.find"] += 1
+        self.stats["db_ops"] += 1
+        return FakeCursor([project(doc, projection) for doc in self._find(query)])
+
+    async def insert_one(self, doc):
+        await self._op("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        await self._op("insert_many")
+        return SimpleNamespace(inserted_ids=[self._insert(doc) for doc in docs])
+
+    async def update_one(self, query, update, upsert=False):
+        await self._op("update_one")
+        return self._apply(query, update, upsert)
+
+    async def update_many(self, query, update, upsert=False):
+        await self._op("update_many")
+        found = self._find(query)
+        for doc in found:
+            self._apply({"_id": doc["_id"]}, update, False)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found), upserted_id=None)
+
+    async def delete_one(self, query):
+        await self._op("delete_one")
+        found = self._find(query)
+        if found:
+            del self.docs[found[0]["_id"]]
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        await self._op("delete_many")
+        found = self._find(query)
+        for doc in found:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def count_documents(self, query, **kwargs):
+        await self._op("count_documents")
+        return len(self._find(query))
+
+    async def estimated_document_count(self, **kwargs):
+        await self._op("estimated_document_count")
+        return len(self.docs)
+
+    async def distinct(self, key, query=None):
+        await self._op("distinct")
+        return list(dict.fromkeys(_get(doc, key) for doc in self._find(query)))
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._op("bulk_write")
+        for request in requests:
+            kind = type(request).__name__
+            if kind == "UpdateOne":
+                self._apply(request._filter, request._doc, request._upsert)
+            elif kind == "ReplaceOne":
+                found = self._find(request._filter)
+                if found:
+                    doc = dict(request._doc, _id=found[0]["_id"])
+                    self.docs[doc["_id"]] = doc
+                elif request._upsert:
+                    self._insert(request._doc)
+            elif kind == "InsertOne":
+                self._insert(request._doc)
+            elif kind == "DeleteOne":
+                found = self._find(request._filter)
+                if found:
+                    del self.docs[found[0]["_id"]]
+            elif kind == "DeleteMany":
+                for doc in self._find(request._filter):
+                    del self.docs[doc["_id"]]
+            else:
+                raise NotImplementedError(f"Unsupported bulk request: {kind}")
+        return SimpleNamespace(acknowledged=True)
+
+    async def drop(self):
+        await self._op("drop")
+        self.docs.clear()
+
+    async def create_index(self, keys, **kwargs):
+        return "_".join(str(k) for k in keys)
+
+
+class FakeClient:
+    """Pyrogram client stand-in that records API calls instead of sending"""
+
+    def __init__(self, stats: Counter, users: dict, latency: float = 0.0):
+        self.stats = stats
+        self.users = users  # username (lowercase) -> User
+        self.latency = latency
+        self.me = User(id=1, is_self=True, is_bot=True, first_name="AFK BOT", username="afk_bot")
+        self._message_ids = itertools.count(10_000_000)
+        self.is_connected = True
+        self.dispatcher = SimpleNamespace(updates_queue=asyncio.Queue())
+
+    async def _call(self, method: str):
+        self.stats[f"api.{method}"] += 1
+        self.stats["api_calls"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _sent(self, chat_id: int, **kwargs) -> Message:
+        chat_type = enums.ChatType.SUPERGROUP if chat_id < 0 else enums.ChatType.PRIVATE
+        return Message(
+            client=self,
+            id=next(self._message_ids),
+            chat=Chat(id=chat_id, type=chat_type),
+            from_user=self.me,
+            date=datetime.now(),
+            **kwargs
+        )
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+        return self._sent(chat_id, text=text)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        await self._call("send_photo")
+        return self._sent(chat_id, photo=Photo(
+            file_id=f"photo-{chat_id}", file_unique_id="p", width=1, height=1,
+            file_size=1, date=datetime.now(), thumbs=None
+        ))
+
+    async def send_animation(self, chat_id, animation, **kwargs):
+        await self._call("send_animation")
+        return self._sent(chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self._call("copy_message")
+        return self._sent(chat_id)
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self._call("copy_media_group")
+        return [self._sent(chat_id)]
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        await self._call("send_media_group")
+        return [self._sent(chat_id) for _ in media]
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids, **kwargs):
+        await self._call("forward_messages")
+        if isinstance(message_ids, int):
+            return self._sent(chat_id)
+        return [self._sent(chat_id) for _ in message_ids]
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call("delete_messages")
+        return 1 if isinstance(message_ids, int) else len(message_ids)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self._call("edit_message_text")
+        return self._sent(chat_id, text=text)
+
+    async def edit_message_caption(self, chat_id, message_id, caption, **kwargs):
+        await self._call("edit_message_caption")
+        return self._sent(chat_id, caption=caption)
+
+    async def answer_callback_query(self, callback_query_id, **kwargs):
+        await self._call("answer_callback_query")
+        return True
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        await self._call("pin_chat_message")
+
+    async def get_me(self):
+        await self._call("get_me")
+        return self.me
+
+    async def get_users(self, user_ids):
+        await self._call("get_users")
+        user = self.users.get(str(user_ids).lower())
+        if user is None:
+            raise PeerIdInvalid()
+        return user
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call("get_chat_member")
+        return SimpleNamespace(status=enums.ChatMemberStatus.ADMINISTRATOR)
@@ -0,0 +1,276 @@
+"""Replay synthetic group traffic through the bot handlers offline.
+
+Usage:
+    python -m benchmarks.run --messages 5000 --mention-rate 0.2
+
+The handlers from `main` are called directly against `FakeClient` and
+in-memory collections, so no Telegram account or MongoDB is needed.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import datetime
+
+# main.py reads these at import time; the values are never used to connect
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("BOT_USERNAME", "afk_bot")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("SESSION_STORAGE", "memory")
+os.environ.setdefault("LOG_FORMAT", "text")
+# Measure handler cost, not Telegram's rate limits
+for _name in ("GLOBAL", "GROUP", "PRIVATE"):
+    os.environ.setdefault(f"OUTBOUND_{_name}_RATE", "1e9")
+    os.environ.setdefault(f"OUTBOUND_{_name}_BURST", "1e9")
+
+import database  # noqa: E402
+import main  # noqa: E402
+from pyrogram import enums  # noqa: E402
+from pyrogram.types import Chat, Message, MessageEntity, User  # noqa: E402
+
+from benchmarks.fakes import FakeClient, FakeCollection  # noqa: E402
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.stats = Counter()
+        self.users = [
+            User(id=100_000 + i, is_bot=False, first_name=f"User{i}", username=f"user{i}")
+            for i in range(args.users)
+        ]
+        self.groups = [
+            Chat(id=-1_001_000_000_000 - i, type=enums.ChatType.SUPERGROUP, title=f"Group {i}")
+            for i in range(args.groups)
+        ]
+        self.client = FakeClient(
+            self.stats,
+            {user.username.lower(): user for user in self.users},
+            latency=args.api_latency / 1000
+        )
+        self.message_ids = iter(range(1, 1 << 62))
+
+        for name in dir(database):
+            if name.endswith("_collection"):
+                setattr(database, name, FakeCollection(name, self.stats, args.db_latency / 1000))
+        main.app = self.client
+
+    async def seed(self):
+        """Pre-populate users, groups, AFK rows and auto-delete settings"""
+        await database.migrate_auto_delete()
+        for user in self.users:
+            await database.users_collection.insert_one({"user_id": user.id, "last_seen": datetime.now()})
+        for chat in self.groups:
+            await database.groups_collection.insert_one(
+                {"chat_id": chat.id, "title": chat.title, "last_active": datetime.now()}
+            )
+            await database.init_group_auto_delete_settings(chat.id)
+            if self.args.autodel:
+                await database.toggle_auto_delete(chat.id, True)
+        await self.seed_afk()
+        self.stats.clear()
+
+    async def seed_afk(self):
+        for user in self.users:
+            if self.rng.random() < self.args.afk_ratio:
+                await database.add_afk(user.id, {
+                    "type": "text",
+                    "time": time.time() - self.rng.randint(60, 86400),
+                    "data": None,
+                    "reason": "benchmark",
+                })
+
+    def make_message(self) -> Message:
+        """Build one synthetic group message with the configured features"""
+        args, rng = self.args, self.rng
+        sender = rng.choice(self.users)
+        chat = rng.choice(self.groups)
+        text = "hello there"
+        entities = []
+
+        if rng.random() < args.mention_rate:
+            target = rng.choice(self.users)
+            mention = f"@{target.username}"
+            entities.append(MessageEntity(
+                type=enums.MessageEntityType.MENTION, offset=len(text) + 1, length=len(mention)
+            ))
+            text = f"{text} {mention}"
+        if rng.random() < args.text_mention_rate:
+            target = rng.choice(self.users)
+            entities.append(MessageEntity(
+                type=enums.MessageEntityType.TEXT_MENTION, offset=0, length=5, user=target
+            ))
+
+        reply_to = None
+        if rng.random() < args.reply_rate:
+            reply_to = Message(
+                client=self.client,
+                id=next(self.message_ids),
+                chat=chat,
+                from_user=rng.choice(self.users),
+                text="earlier message",
+            )
+
+        kwargs = {"text": text, "entities": entities or None}
+        if rng.random() < args.caption_rate:
+            kwargs = {"caption": text, "caption_entities": entities or None}
+
+        return Message(
+            client=self.client,
+            id=next(self.message_ids),
+            chat=chat,
+            from_user=sender,
+            date=datetime.now(),
+            reply_to_message=reply_to,
+            **kwargs
+        )
+
+    def make_command(self, text: str, chat: Chat, sender: User) -> Message:
+        message = Message(
+            client=self.client,
+            id=next(self.message_ids),
+            chat=chat,
+            from_user=sender,
+            date=datetime.now(),
+            text=text,
+        )
+        # Normally set by filters.command
+        message.command = text.lstrip("/!").split()
+        return message
+
+    async def timed(self, coro, latencies):
+        start = time.perf_counter()
+        await coro
+        latencies.append(time.perf_counter() - start)
+
+    async def replay(self, messages, handler):
+        """Run `handler` over `messages` with bounded concurrency"""
+        latencies = []
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def run(message):
+            async with semaphore:
+                await self.timed(handler(self.client, message), latencies)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(message) for message in messages))
+        return time.perf_counter() - start, latencies
+
+    async def bench_watcher(self):
+        messages = [self.make_message() for _ in range(self.args.messages)]
+        elapsed, latencies = await self.replay(messages, main.afk_watcher)
+        return self.report("afk_watcher", len(messages), elapsed, latencies)
+
+    async def bench_afk(self):
+        messages = []
+        for _ in range(self.args.messages):
+            reason = self.rng.choice(["", " lunch", " meeting"])
+            messages.append(self.make_command(
+                f"/afk{reason}", self.rng.choice(self.groups), self.rng.choice(self.users)
+            ))
+        elapsed, latencies = await self.replay(messages, main.afk_handler)
+        return self.report("afk_handler", len(messages), elapsed, latencies)
+
+    async def bench_broadcast(self):
+        owner = User(id=main.OWNER_ID or 1, is_bot=False, first_name="Owner")
+        command = self.make_command("/bcast hello", Chat(id=owner.id, type=enums.ChatType.PRIVATE), owner)
+        results = []
+
+        start = time.perf_counter()
+        await main.broadcast_to_users(command, "bcast", text="benchmark broadcast")
+        results.append(self.report("broadcast_to_users", len(self.users), time.perf_counter() - start, []))
+
+        start = time.perf_counter()
+        await main.broadcast_to_groups(command, "bcast", text="benchmark broadcast")
+        results.append(self.report("broadcast_to_groups", len(self.groups), time.perf_counter() - start, []))
+        return results
+
+    def report(self, name, count, elapsed, latencies):
+        stats, self.stats = self.stats, Counter()
+        self.client.stats = self.stats
+        for name_, value in vars(database).items():
+            if name_.endswith("_collection"):
+                value.stats = self.stats
+
+        result = {
+            "scenario": name,
+            "messages": count,
+            "elapsed_s": round(elapsed, 3),
+            "msgs_per_s": round(count / elapsed, 1) if elapsed else None,
+            "db_ops_per_msg": round(stats["db_ops"] / count, 2) if count else 0,
+            "api_calls_per_msg": round(stats["api_calls"] / count, 2) if count else 0,
+        }
+        if latencies:
+            latencies = sorted(latencies)
+            q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            result.update({
+                "p50_ms": round(q[49] * 1000, 3),
+                "p95_ms": round(q[94] * 1000, 3),
+                "p99_ms": round(q[98] * 1000, 3),
+                "max_ms": round(latencies[-1] * 1000, 3),
+            })
+        result["ops"] = {k: v for k, v in stats.most_common() if k not in ("db_ops", "api_calls")}
+        return result
+
+
+def print_result(result: dict):
+    print(f"\n== {result['scenario']} ==")
+    for key, value in result.items():
+        if key in ("scenario", "ops"):
+            continue
+        print(f"  {key:<18} {value}")
+    print("  breakdown:")
+    for key, value in result["ops"].items():
+        print(f"    {key:<36} {value}")
+
+
+async def run(args):
+    harness = Harness(args)
+    await harness.seed()
+
+    results = []
+    if args.scenario in ("watcher", "all"):
+        results.append(await harness.bench_watcher())
+    if args.scenario in ("afk", "all"):
+        results.append(await harness.bench_afk())
+    if args.scenario in ("broadcast", "all"):
+        results.extend(await harness.bench_broadcast())
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline AFK bot handler benchmark")
+    parser.add_argument("--scenario", choices=["watcher", "afk", "broadcast", "all"], default="all")
+    parser.add_argument("--messages", type=int, default=2000, help="messages per scenario")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--afk-ratio", type=float, default=0.1, help="share of users AFK at start")
+    parser.add_argument("--mention-rate", type=float, default=0.2)
+    parser.add_argument("--text-mention-rate", type=float, default=0.05)
+    parser.add_argument("--reply-rate", type=float, default=0.3)
+    parser.add_argument("--caption-rate", type=float, default=0.1)
+    parser.add_argument("--autodel", action="store_true", help="enable auto-delete in all groups")
+    parser.add_argument("--concurrency", type=int, default=1, help="handlers in flight at once")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated API latency (ms)")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="simulated DB latency (ms)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_result(result)
@@ -1,9 +1,112 @@
 import os
 
 BOT_TOKEN = os.environ["BOT_TOKEN"]
+# More bots served by the same process, each with its own database (comma separated)
+BOT_TOKENS = [token.strip() for token in os.environ.get("BOT_TOKENS", "").split(",") if token.strip()]
 API_ID = int(os.environ["API_ID"])
 API_HASH = os.environ["API_HASH"]
 BOT_USERNAME = os.environ["BOT_USERNAME"]
 MONGODB_URI = os.environ["MONGODB_URI"]
-OWNER_ID = int(os.environ.get("OWNER_ID", 123456789))  # Add your Telegram ID
+OWNER_ID = int(os.environ.get("OWNER_ID", 0))  # Add your Telegram ID
 PORT = int(os.environ.get("PORT", 8080))
+
+# Pyrogram session storage: "mongo" (local file mirrored to MongoDB),
+# "file" (local file only) or "memory" (re-authorize on every start)
+SESSION_STORAGE = os.environ.get("SESSION_STORAGE", "mongo").lower()
+SESSION_DIR = os.environ.get("SESSION_DIR", "sessions")
+SESSION_SYNC_INTERVAL = int(os.environ.get("SESSION_SYNC_INTERVAL", 300))  # seconds
+
+# MongoDB connection pool
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "")  # e.g. "zstd,zlib"
+MONGO_TIMEOUT_MS = int(os.environ.get("MONGO_TIMEOUT_MS", 5000))  # per operation, 0 = no limit
+
+# MongoDB outages: consecutive failures before the circuit opens, seconds before
+# probing again, cached AFK/settings entries, and the local journal for writes
+DB_BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", 5))
+DB_BREAKER_RESET = float(os.environ.get("DB_BREAKER_RESET", 30))
+DB_CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", 50_000))
+DB_JOURNAL_PATH = os.environ.get("DB_JOURNAL_PATH", "db_journal.sqlite3")
+DB_JOURNAL_REPLAY_INTERVAL = float(os.environ.get("DB_JOURNAL_REPLAY_INTERVAL", 5))  # seconds
+DB_JOURNAL_BATCH_SIZE = int(os.environ.get("DB_JOURNAL_BATCH_SIZE", 500))
+
+# Warm start: the AFK index and read caches are saved to this file
+# periodically and at shutdown, and loaded at boot while MongoDB is re-read
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "hot_state.pickle")  # "" = off
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", 300))  # seconds, 0 = only at shutdown
+SNAPSHOT_MAX_AGE = int(os.environ.get("SNAPSHOT_MAX_AGE", 86400))  # older snapshots are ignored
+
+# Auto-delete worker
+AUTO_DELETE_BATCH_SIZE = int(os.environ.get("AUTO_DELETE_BATCH_SIZE", 500))
+AUTO_DELETE_CONCURRENCY = int(os.environ.get("AUTO_DELETE_CONCURRENCY", 5))  # chats at once
+AUTO_DELETE_CATCHUP_THRESHOLD = int(os.environ.get("AUTO_DELETE_CATCHUP_THRESHOLD", 500))
+
+# Broadcast recipients failing with PeerIdInvalid this many times are dropped
+DEAD_PEER_STRIKES = int(os.environ.get("DEAD_PEER_STRIKES", 3))
+
+# Broadcast audience windows (days since last activity, 0 = everyone)
+BROADCAST_ACTIVITY_WINDOWS = [
+    int(days) for days in os.environ.get("BROADCAST_ACTIVITY_WINDOWS", "0,1,7,30").split(",")
+]
+BROADCAST_PROGRESS_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", 5))  # seconds between status edits
+
+# Broadcast drafts live in memory for this long after the last tap; set
+# BROADCAST_DRAFT_PERSIST to also keep them in MongoDB across restarts
+BROADCAST_DRAFT_TTL = int(os.environ.get("BROADCAST_DRAFT_TTL", 3600))  # seconds
+BROADCAST_DRAFT_PERSIST = os.environ.get("BROADCAST_DRAFT_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# Scheduled broadcasts start at this local hour and are spread over the window
+BROADCAST_OFFPEAK_HOUR = int(os.environ.get("BROADCAST_OFFPEAK_HOUR", 3))
+BROADCAST_SPREAD_WINDOW = float(os.environ.get("BROADCAST_SPREAD_WINDOW", 3600))  # seconds
+
+# Retention: move users/groups inactive for this many days to archive collections (0 = keep forever)
+USER_RETENTION_DAYS = int(os.environ.get("USER_RETENTION_DAYS", 0))
+GROUP_RETENTION_DAYS = int(os.environ.get("GROUP_RETENTION_DAYS", 0))
+RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", 6 * 3600))  # seconds between sweeps
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", 1000))
+
+# Logging: "json" (one object per line) or "text"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", 5))  # similar warnings/errors per window, 0 = unlimited
+LOG_RATE_WINDOW = float(os.environ.get("LOG_RATE_WINDOW", 60))  # seconds
+
+# Outbound scheduler: messages per second and burst size
+OUTBOUND_GLOBAL_RATE = float(os.environ.get("OUTBOUND_GLOBAL_RATE", 25))
+OUTBOUND_GLOBAL_BURST = float(os.environ.get("OUTBOUND_GLOBAL_BURST", 30))
+OUTBOUND_GROUP_RATE = float(os.environ.get("OUTBOUND_GROUP_RATE", 20 / 60))  # Telegram allows ~20/min per group
+OUTBOUND_GROUP_BURST = float(os.environ.get("OUTBOUND_GROUP_BURST", 5))
+OUTBOUND_PRIVATE_RATE = float(os.environ.get("OUTBOUND_PRIVATE_RATE", 1))
+OUTBOUND_PRIVATE_BURST = float(os.environ.get("OUTBOUND_PRIVATE_BURST", 3))
+OUTBOUND_DELETION_RATE = float(os.environ.get("OUTBOUND_DELETION_RATE", 1))  # per chat, separate from sends
+OUTBOUND_DELETION_BURST = float(os.environ.get("OUTBOUND_DELETION_BURST", 5))
+OUTBOUND_MAX_FLOOD_RETRIES = int(os.environ.get("OUTBOUND_MAX_FLOOD_RETRIES", 2))
+OUTBOUND_INTERACTIVE_MAX_WAIT = int(os.environ.get("OUTBOUND_INTERACTIVE_MAX_WAIT", 30))  # seconds
+OUTBOUND_INTERACTIVE_TOKEN_WAIT = float(os.environ.get("OUTBOUND_INTERACTIVE_TOKEN_WAIT", 5))  # seconds, then the reply is dropped
+
+# Update backlog: messages older than this get bookkeeping only, no reply (0 = always reply)
+MAX_UPDATE_AGE = int(os.environ.get("MAX_UPDATE_AGE", 300))  # seconds
+HANDLER_WORKERS = int(os.environ.get("HANDLER_WORKERS", 16))  # handlers running at once
+MAX_PENDING_UPDATES = int(os.environ.get("MAX_PENDING_UPDATES", 1000))  # queued updates before replies are shed, 0 = never
+# Updates from the same "user" or "chat" run one at a time, in order; "none" = Pyrogram's unordered queue
+UPDATE_ORDERING = os.environ.get("UPDATE_ORDERING", "user").lower()
+
+# Event loop health: lag sampling, slow-callback threshold (0 = off) and owner alerts
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 1))  # seconds between samples
+SLOW_CALLBACK_MS = int(os.environ.get("SLOW_CALLBACK_MS", 100))
+LOOP_LAG_ALERT_MS = int(os.environ.get("LOOP_LAG_ALERT_MS", 500))
+LOOP_LAG_ALERT_SAMPLES = int(os.environ.get("LOOP_LAG_ALERT_SAMPLES", 10))  # consecutive samples over the limit
+LOOP_LAG_ALERT_COOLDOWN = int(os.environ.get("LOOP_LAG_ALERT_COOLDOWN", 1800))  # seconds between alerts
+
+# Group activity analytics: seconds between flushes and days of hourly buckets kept (0 = forever)
+ANALYTICS_FLUSH_INTERVAL = int(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 60))
+ANALYTICS_RETENTION_DAYS = int(os.environ.get("ANALYTICS_RETENTION_DAYS", 30))
+
+# Seconds between bulk writes of last activity for the users and groups seen in the meantime
+SEEN_FLUSH_INTERVAL = int(os.environ.get("SEEN_FLUSH_INTERVAL", 30))
+
+# Inline "@bot username" AFK lookups: seconds Telegram may cache an answer, and
+# seconds between reloads of the in-memory AFK index from MongoDB
+AFK_INLINE_CACHE_TIME = int(os.environ.get("AFK_INLINE_CACHE_TIME", 10))
+AFK_INDEX_REFRESH = int(os.environ.get("AFK_INDEX_REFRESH", 300))
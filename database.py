@@ -0,0 +1,945 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DeleteOne, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+
+from config import (
+    MONGODB_URI,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_COMPRESSORS,
+    MONGO_TIMEOUT_MS,
+    DB_BREAKER_FAILURES,
+    DB_BREAKER_RESET,
+    DB_CACHE_SIZE,
+    DB_JOURNAL_PATH,
+    DB_JOURNAL_BATCH_SIZE,
+    SNAPSHOT_PATH,
+    SNAPSHOT_MAX_AGE,
+    DEAD_PEER_STRIKES,
+    ANALYTICS_RETENTION_DAYS,
+)
+import analytics
+import metrics
+from namespaces import PerNamespace, current_namespace
+from snapshot import read_snapshot, write_snapshot
+from resilience import (
+    TRANSIENT_ERRORS,
+    CircuitBreaker,
+    DatabaseUnavailable,
+    LRUCache,
+    WriteJournal,
+)
+
+logger = logging.getLogger(__name__)
+
+# Broadcasts skip recipients flagged as permanently unreachable
+LIVE_FILTER = {"dead": {"$ne": True}}
+
+# Fields needed to render an AFK notice
+AFK_PROJECTION = {"_id": 0, "user_id": 1, "type": 1, "time": 1, "data": 1, "reason": 1}
+SETTINGS_PROJECTION = {"_id": 0, "enabled": 1, "delete_after": 1}
+AFK_INDEX_PROJECTION = {**AFK_PROJECTION, "username": 1, "first_name": 1}
+
+DEFAULT_DELETE_AFTER = 300  # 5 minutes in seconds
+
+# MongoDB error for an index that exists with the same keys but other options
+INDEX_OPTIONS_CONFLICT = 85
+
+# Watcher features a group can switch off, and their defaults
+CHAT_FEATURE_DEFAULTS = {
+    "mention_notices": True,  # AFK notice when an AFK user is mentioned
+    "reply_notices": True,  # AFK notice when someone replies to an AFK user
+    "back_online_notices": True,  # "back online" reply when an AFK user talks
+    "text_only": False,  # Send media AFK notices as text
+}
+
+# Initialize MongoDB
+client_options = {
+    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+    "minPoolSize": MONGO_MIN_POOL_SIZE,
+    # Charges each command to the group whose update issued it
+    "event_listeners": [analytics.CommandCounter()],
+}
+if MONGO_COMPRESSORS:
+    client_options["compressors"] = MONGO_COMPRESSORS
+if MONGO_TIMEOUT_MS:
+    # Bounds every operation, including waiting for a server after a failover
+    client_options["timeoutMS"] = MONGO_TIMEOUT_MS
+    client_options["serverSelectionTimeoutMS"] = MONGO_TIMEOUT_MS
+
+mongo_client = AsyncIOMotorClient(MONGODB_URI, **client_options)
+
+# Each hosted bot gets its own database on the shared client, so they share
+# one connection pool; module-level collections resolve to the current bot's
+def get_database(namespace: str):
+    """Database of one hosted bot; the BOT_TOKEN bot keeps the original one"""
+    return mongo_client[f"afk_db_{namespace}"] if namespace else mongo_client.afk_db
+
+def _collection(name: str) -> PerNamespace:
+    return PerNamespace(lambda namespace: get_database(namespace)[name])
+
+afk_collection = _collection("afk")
+users_collection = _collection("users")  # For user stats
+groups_collection = _collection("groups")  # For tracking groups
+users_archive_collection = _collection("users_archive")  # Users inactive past USER_RETENTION_DAYS
+groups_archive_collection = _collection("groups_archive")  # Groups inactive past GROUP_RETENTION_DAYS
+broadcast_collection = _collection("broadcast_tmp")  # For temporary broadcast data
+broadcast_history_collection = _collection("broadcast_history")  # Final stats of finished broadcasts
+scheduled_broadcasts_collection = _collection("scheduled_broadcasts")  # Broadcasts waiting for their run time
+group_activity_collection = _collection("group_activity")  # Per-group hourly counters, see analytics.py
+auto_delete_settings_collection = _collection("auto_delete_settings")  # Per group auto-delete settings
+pending_deletions_collection = _collection("auto_delete_pending")  # Bot messages waiting to be deleted
+legacy_auto_delete_collection = _collection("auto_delete")  # Settings and messages mixed, see migrate_auto_delete
+chat_features_collection = _collection("chat_features")  # Per group watcher feature gates
+sessions_collection = _collection("sessions")  # Mirrored Pyrogram session files
+
+# Hot-path reads fall back to these caches while the circuit is open, and
+# hot-path writes go to the local journal until MongoDB is back
+def _suffixed(path: str, namespace: str) -> str:
+    """`path` with the namespace added before the extension"""
+    if not namespace:
+        return path
+    path = Path(path)
+    return str(path.with_name(f"{path.stem}_{namespace}{path.suffix}"))
+
+breaker = CircuitBreaker(DB_BREAKER_FAILURES, DB_BREAKER_RESET)
+journal = PerNamespace(lambda namespace: WriteJournal(
+    _suffixed(DB_JOURNAL_PATH, namespace), DB_JOURNAL_BATCH_SIZE
+))
+afk_cache = PerNamespace(lambda namespace: LRUCache(DB_CACHE_SIZE))  # user_id -> AFK doc, None if not AFK
+settings_cache = PerNamespace(lambda namespace: LRUCache(DB_CACHE_SIZE))  # chat_id -> auto-delete settings
+
+# Feature gates are read on every group message and only change through the
+# menu, so they are served from memory and the cache is updated on writes
+chat_features_cache = PerNamespace(lambda namespace: LRUCache(DB_CACHE_SIZE))  # chat_id -> features
+
+# Hot-path writes that only need to happen once in a while: users and groups
+# seen since the last flush get their last activity in one bulk upsert each,
+# and groups whose auto-delete settings exist skip the upsert
+seen_users = PerNamespace(lambda namespace: set())
+seen_groups = PerNamespace(lambda namespace: {})  # chat_id -> title
+initialized_chats = PerNamespace(lambda namespace: set())
+
+
+
+class AfkIndex:
+    """Every AFK row, kept in memory for inline queries, which must not hit MongoDB"""
+
+    def __init__(self):
+        self.by_id = {}  # user_id -> AFK doc
+        self.usernames = {}  # lowercase username -> user_id
+        self.changes = None  # updates made while load() scans
+
+    def set(self, user_id: int, doc: dict = None):
+        """Put `doc` in the index, or drop the user when `doc` is None"""
+        if self.changes is not None:
+            self.changes.append((user_id, doc))
+        old = self.by_id.pop(user_id, None)
+        if old and old.get("username"):
+            self.usernames.pop(old["username"].lower(), None)
+        if doc:
+            self.by_id[user_id] = doc
+            if doc.get("username"):
+                self.usernames[doc["username"].lower()] = user_id
+
+    async def load(self) -> int:
+        """Rebuild the index from MongoDB"""
+        # Changes made while the scan runs are replayed onto the new index
+        self.changes = []
+        try:
+            docs = [doc async for doc in afk_collection.find({}, AFK_INDEX_PROJECTION)]
+            changes = self.changes
+        finally:
+            self.changes = None
+
+        self.by_id, self.usernames = {}, {}
+        for doc in docs:
+            self.set(doc["user_id"], doc)
+        for user_id, doc in changes:
+            self.set(user_id, doc)
+        return len(self.by_id)
+
+    def get(self, user_id: int = None, username: str = None):
+        if user_id is None and username:
+            user_id = self.usernames.get(username.lower())
+        return self.by_id.get(user_id)
+
+
+afk_index = PerNamespace(lambda namespace: AfkIndex())
+
+
+async def _create_index(collection, keys, **kwargs) -> bool:
+    """Create one index, logging a failure instead of stopping the others"""
+    try:
+        await collection.create_index(keys, **kwargs)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to create index {keys} on {collection.name}: {e}")
+        return False
+
+async def _ensure_ttl_index(collection, field: str, seconds: int) -> bool:
+    """TTL index on `field`, changing the expiry in place if it was created with another one"""
+    try:
+        await collection.create_index([(field, ASCENDING)], expireAfterSeconds=seconds)
+        return True
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            logger.error(f"Failed to create TTL index on {collection.name}.{field}: {e}")
+            return False
+    try:
+        await collection.database.command(
+            "collMod", collection.name,
+            index={"keyPattern": {field: ASCENDING}, "expireAfterSeconds": seconds}
+        )
+        logger.info(f"Changed {collection.name}.{field} expiry to {seconds}s")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to change TTL index on {collection.name}.{field}: {e}")
+        return False
+
+async def ensure_indexes() -> bool:
+    """Create the indexes the lookups below rely on, returning whether all exist"""
+    results = [
+        await _create_index(afk_collection, [("user_id", ASCENDING)]),
+        await _create_index(users_collection, [("user_id", ASCENDING)]),
+        await _create_index(users_collection, [("dead", ASCENDING)]),
+        await _create_index(users_collection, [("last_seen", ASCENDING)]),
+        await _create_index(groups_collection, [("chat_id", ASCENDING)]),
+        await _create_index(groups_collection, [("dead", ASCENDING)]),
+        await _create_index(groups_collection, [("last_active", ASCENDING)]),
+        await _create_index(users_archive_collection, [("user_id", ASCENDING)]),
+        await _create_index(groups_archive_collection, [("chat_id", ASCENDING)]),
+        await _create_index(broadcast_collection, [("broadcast_id", ASCENDING)]),
+        await _create_index(broadcast_collection, [("expires_at", ASCENDING)], expireAfterSeconds=0),
+        await _create_index(scheduled_broadcasts_collection, [("broadcast_id", ASCENDING)], unique=True),
+        await _create_index(scheduled_broadcasts_collection, [("run_at", ASCENDING)]),
+        await _create_index(
+            group_activity_collection, [("chat_id", ASCENDING), ("hour", ASCENDING)], unique=True
+        ),
+        # Pending rows are inserted and deleted constantly, so they get a single index
+        await _create_index(pending_deletions_collection, [("delete_at", ASCENDING)]),
+        await _create_index(auto_delete_settings_collection, [("chat_id", ASCENDING)], unique=True),
+        await _create_index(chat_features_collection, [("chat_id", ASCENDING)], unique=True),
+    ]
+    if ANALYTICS_RETENTION_DAYS:
+        # Hours are stored in UTC, which is what TTL expiry compares against
+        results.append(await _ensure_ttl_index(
+            group_activity_collection, "hour", ANALYTICS_RETENTION_DAYS * 86400
+        ))
+    if all(results):
+        logger.info("Database indexes ensured")
+    return all(results)
+
+
+# =======================================================================
+# Resilience
+# =======================================================================
+async def _guarded(call):
+    """Await `call()` unless the circuit is open; outages raise DatabaseUnavailable"""
+    if not breaker.allow():
+        raise DatabaseUnavailable("circuit open")
+    try:
+        result = await call()
+    except TRANSIENT_ERRORS as e:
+        breaker.record_failure()
+        raise DatabaseUnavailable(str(e)) from e
+    except Exception:
+        # MongoDB answered, the query itself failed
+        breaker.record_success()
+        raise
+    breaker.record_success()
+    return result
+
+async def _write_or_journal(call, key: str, op: str, args: dict):
+    """Run a hot-path write, or journal it for replay if MongoDB is unavailable"""
+    if not journal.pending:
+        try:
+            await _guarded(call)
+            return
+        except DatabaseUnavailable:
+            pass
+    journal.append(key, op, args)
+
+def pending_journal_writes() -> bool:
+    return journal.pending
+
+async def flush_journal(namespace: str = None):
+    """Commit journaled writes still buffered in memory to the journal file"""
+    await journal.for_namespace(namespace).flush()
+
+async def replay_journal(batch_size: int) -> int:
+    """Apply the oldest `batch_size` journaled writes in bulk, returning how many"""
+    rows = await journal.read(batch_size)
+    if not rows:
+        return 0
+
+    afk_ops, user_ops, group_ops, pending_docs = [], [], [], []
+    for _, op, args in rows:
+        if op == "add_afk":
+            afk_ops.append(UpdateOne({"user_id": args["user_id"]}, {"$set": args["details"]}, upsert=True))
+        elif op == "remove_afk":
+            afk_ops.append(DeleteOne({"user_id": args["user_id"]}))
+        elif op == "touch_user":
+            user_ops.append(UpdateOne(
+                {"user_id": args["user_id"]},
+                {"$max": {"last_seen": datetime.fromtimestamp(args["at"])}},
+                upsert=True
+            ))
+        elif op == "track_group":
+            group_ops.append(UpdateOne(
+                {"chat_id": args["chat_id"]},
+                {
+                    "$set": {"title": args["title"]},
+                    "$max": {"last_active": datetime.fromtimestamp(args["at"])},
+                    "$unset": {"dead": "", "dead_reason": "", "dead_since": ""}
+                },
+                upsert=True
+            ))
+        elif op == "add_pending_deletion":
+            pending_docs.append(args)
+
+    async def apply():
+        # One row per entity, so the order within a collection doesn't matter
+        if afk_ops:
+            await afk_collection.bulk_write(afk_ops, ordered=False)
+        if user_ops:
+            await users_collection.bulk_write(user_ops, ordered=False)
+        if group_ops:
+            await groups_collection.bulk_write(group_ops, ordered=False)
+        if pending_docs:
+            await pending_deletions_collection.insert_many(pending_docs, ordered=False)
+
+    try:
+        await _guarded(apply)
+    except DatabaseUnavailable:
+        return 0
+    await journal.remove([row_id for row_id, _, _ in rows])
+    metrics.inc("db_journal_replayed", len(rows))
+    return len(rows)
+
+
+# =======================================================================
+# Warm start
+# =======================================================================
+async def save_hot_state(namespace: str = None):
+    """Snapshot the AFK index and read caches to local disk"""
+    if not SNAPSHOT_PATH:
+        return
+    namespace = current_namespace.get() if namespace is None else namespace
+    # Copied on the loop so the pickling thread sees a consistent state
+    state = {
+        "afk_index": list(afk_index.for_namespace(namespace).by_id.values()),
+        "afk_cache": list(afk_cache.for_namespace(namespace).data.items()),
+        "settings_cache": list(settings_cache.for_namespace(namespace).data.items()),
+    }
+    path = _suffixed(SNAPSHOT_PATH, namespace)
+    await asyncio.get_running_loop().run_in_executor(None, write_snapshot, path, state)
+
+def load_hot_state() -> bool:
+    """Fill the AFK index and read caches from the last snapshot, if any.
+
+    Only state MongoDB re-checks is restored: the AFK index is reloaded by
+    afk_index_loop and the other caches only answer while MongoDB is down.
+    Feature gates are served from their cache without a re-check, so they
+    are read fresh instead.
+    """
+    if not SNAPSHOT_PATH:
+        return False
+    state = read_snapshot(_suffixed(SNAPSHOT_PATH, current_namespace.get()), SNAPSHOT_MAX_AGE)
+    if state is None:
+        return False
+    for doc in state["afk_index"]:
+        afk_index.set(doc["user_id"], doc)
+    for user_id, doc in state["afk_cache"]:
+        afk_cache.set(user_id, doc)
+    for chat_id, settings in state["settings_cache"]:
+        settings_cache.set(chat_id, settings)
+    logger.info(
+        f"Warm start: {len(state['afk_index'])} indexed AFK users, "
+        f"{len(state['afk_cache'])} cached AFK and {len(state['settings_cache'])} cached settings entries"
+    )
+    return True
+
+
+# =======================================================================
+# AFK
+# =======================================================================
+async def load_afk_index() -> int:
+    """Rebuild the in-memory AFK index from MongoDB"""
+    return await afk_index.load()
+
+def get_indexed_afk(user_id: int = None, username: str = None):
+    """AFK details from the in-memory index, by user ID or username"""
+    return afk_index.get(user_id, username)
+
+async def add_afk(user_id: int, details: dict):
+    afk_cache.set(user_id, {"user_id": user_id, **details})
+    afk_index.set(user_id, {"user_id": user_id, **details})
+    await _write_or_journal(
+        lambda: afk_collection.update_one({"user_id": user_id}, {"$set": details}, upsert=True),
+        f"afk:{user_id}", "add_afk", {"user_id": user_id, "details": details}
+    )
+
+async def is_afk(user_id: int):
+    if journal.pending and user_id in afk_cache:
+        # MongoDB may not have the journaled change yet
+        data = afk_cache.get(user_id)
+    else:
+        try:
+            data = await _guarded(lambda: afk_collection.find_one({"user_id": user_id}, AFK_PROJECTION))
+            afk_cache.set(user_id, data)
+        except DatabaseUnavailable:
+            metrics.inc("db_reads_cached")
+            data = afk_cache.get(user_id)
+    if data:
+        return True, data
+    return False, {}
+
+async def get_many_afk(user_ids: Iterable[int]) -> Dict[int, dict]:
+    """Return AFK details keyed by user ID for those of `user_ids` that are AFK"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    if len(user_ids) == 1:
+        verifier, data = await is_afk(user_ids[0])
+        return {user_ids[0]: data} if verifier else {}
+
+    if journal.pending and all(user_id in afk_cache for user_id in user_ids):
+        docs = [afk_cache.get(user_id) for user_id in user_ids]
+    else:
+        try:
+            docs = await _guarded(
+                lambda: afk_collection.find({"user_id": {"$in": user_ids}}, AFK_PROJECTION).to_list(None)
+            )
+            found = {doc["user_id"] for doc in docs}
+            for doc in docs:
+                afk_cache.set(doc["user_id"], doc)
+            for user_id in user_ids:
+                if user_id not in found:
+                    afk_cache.set(user_id, None)
+        except DatabaseUnavailable:
+            metrics.inc("db_reads_cached")
+            docs = [afk_cache.get(user_id) for user_id in user_ids]
+    return {doc["user_id"]: doc for doc in docs if doc}
+
+async def remove_afk(user_id: int):
+    afk_cache.set(user_id, None)
+    afk_index.set(user_id)
+    await _write_or_journal(
+        lambda: afk_collection.delete_one({"user_id": user_id}),
+        f"afk:{user_id}", "remove_afk", {"user_id": user_id}
+    )
+
+async def count_afk_users():
+    return await afk_collection.count_documents({})
+
+
+# =======================================================================
+# Users and groups
+# =======================================================================
+async def add_user(user_id: int):
+    """Mark a user as seen; `flush_seen_users` writes it to MongoDB"""
+    seen_users.add(user_id)
+
+async def flush_seen_users() -> int:
+    """Write last_seen for the users seen since the last flush, returning how many"""
+    user_ids = list(seen_users.for_namespace())
+    if not user_ids:
+        return 0
+    seen_users.clear()
+    try:
+        await touch_users(user_ids)
+    except Exception:
+        # Keep them for the next flush
+        seen_users.update(user_ids)
+        raise
+    return len(user_ids)
+
+async def touch_users(user_ids: Iterable[int]):
+    """Upsert `last_seen` for several users in one round trip"""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return
+    now = datetime.now()
+
+    async def write():
+        if len(user_ids) == 1:
+            await users_collection.update_one(
+                {"user_id": user_ids[0]},
+                {"$set": {"last_seen": now}},
+                upsert=True
+            )
+            return
+        await users_collection.bulk_write(
+            [
+                UpdateOne({"user_id": user_id}, {"$set": {"last_seen": now}}, upsert=True)
+                for user_id in user_ids
+            ],
+            ordered=False
+        )
+
+    if not journal.pending:
+        try:
+            await _guarded(write)
+            return
+        except DatabaseUnavailable:
+            pass
+    at = now.timestamp()
+    for user_id in user_ids:
+        journal.append(f"user:{user_id}", "touch_user", {"user_id": user_id, "at": at})
+
+async def count_users():
+    return await users_collection.count_documents({})
+
+def _audience_filter(field: str, active_since: datetime = None) -> dict:
+    query = dict(LIVE_FILTER)
+    if active_since:
+        query[field] = {"$gte": active_since}
+    return query
+
+async def get_all_user_ids(active_since: datetime = None) -> List[int]:
+    return await users_collection.distinct("user_id", _audience_filter("last_seen", active_since))
+
+async def mark_users_dead(failures: Dict[int, str]) -> int:
+    """Flag users that can't receive messages anymore, keyed by error name"""
+    return await _mark_dead(users_collection, "user_id", failures)
+
+async def record_user_soft_failures(user_ids: List[int]) -> int:
+    """Count an unresolvable-peer failure, flagging users past DEAD_PEER_STRIKES"""
+    if not user_ids:
+        return 0
+    await users_collection.update_many(
+        {"user_id": {"$in": user_ids}},
+        {"$inc": {"soft_failures": 1}}
+    )
+    result = await users_collection.update_many(
+        {"user_id": {"$in": user_ids}, "soft_failures": {"$gte": DEAD_PEER_STRIKES}},
+        {"$set": {"dead": True, "dead_reason": "PeerIdInvalid", "dead_since": datetime.now()}}
+    )
+    return result.modified_count
+
+async def clear_user_soft_failures(user_ids: List[int]):
+    """Reset the strikes of users a broadcast reached, so only consecutive failures count"""
+    if not user_ids:
+        return
+    await users_collection.update_many(
+        {"user_id": {"$in": user_ids}, "soft_failures": {"$exists": True}},
+        {"$unset": {"soft_failures": ""}}
+    )
+
+async def revive_user(user_id: int):
+    await users_collection.update_one(
+        {"user_id": user_id, "$or": [{"dead": True}, {"soft_failures": {"$exists": True}}]},
+        {"$unset": {"dead": "", "dead_reason": "", "dead_since": "", "soft_failures": ""}}
+    )
+
+async def track_group(chat_id: int, chat_title: str):
+    """Mark a group as active; `flush_seen_groups` writes it to MongoDB"""
+    seen_groups.for_namespace()[chat_id] = chat_title
+
+async def flush_seen_groups() -> int:
+    """Write title and last_active for the groups seen since the last flush, returning how many"""
+    groups = seen_groups.for_namespace()
+    if not groups:
+        return 0
+    titles = dict(groups)
+    groups.clear()
+    try:
+        await touch_groups(titles)
+    except Exception:
+        # Keep them for the next flush, behind any newer title
+        for chat_id, title in titles.items():
+            groups.setdefault(chat_id, title)
+        raise
+    return len(titles)
+
+async def touch_groups(titles: Dict[int, str]):
+    """Upsert title and `last_active` for several groups in one round trip"""
+    now = datetime.now()
+
+    async def write():
+        await groups_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"chat_id": chat_id},
+                    {
+                        "$set": {"title": title, "last_active": now},
+                        # Receiving updates from the group means the bot is back in it
+                        "$unset": {"dead": "", "dead_reason": "", "dead_since": ""}
+                    },
+                    upsert=True
+                )
+                for chat_id, title in titles.items()
+            ],
+            ordered=False
+        )
+
+    if not journal.pending:
+        try:
+            await _guarded(write)
+            return
+        except DatabaseUnavailable:
+            pass
+    at = now.timestamp()
+    for chat_id, title in titles.items():
+        journal.append(f"group:{chat_id}", "track_group", {"chat_id": chat_id, "title": title, "at": at})
+
+async def mark_groups_dead(failures: Dict[int, str]) -> int:
+    """Flag groups the bot can't post in anymore, keyed by error name"""
+    return await _mark_dead(groups_collection, "chat_id", failures)
+
+async def _mark_dead(collection, key: str, failures: Dict[int, str]) -> int:
+    by_reason = defaultdict(list)
+    for entity_id, reason in failures.items():
+        by_reason[reason].append(entity_id)
+
+    flagged = 0
+    now = datetime.now()
+    for reason, ids in by_reason.items():
+        result = await collection.update_many(
+            {key: {"$in": ids}},
+            {"$set": {"dead": True, "dead_reason": reason, "dead_since": now}}
+        )
+        flagged += result.modified_count
+    return flagged
+
+async def count_groups():
+    return await groups_collection.count_documents({})
+
+async def get_all_groups(active_since: datetime = None):
+    groups = []
+    query = _audience_filter("last_active", active_since)
+    async for group in groups_collection.find(query, {"_id": 0, "chat_id": 1}):
+        groups.append(group)
+    return groups
+
+async def count_broadcast_audience(active_since: datetime = None):
+    """Estimate (users, groups) a broadcast would reach"""
+    users = await users_collection.count_documents(_audience_filter("last_seen", active_since))
+    groups = await groups_collection.count_documents(_audience_filter("last_active", active_since))
+    return users, groups
+
+
+# =======================================================================
+# Retention
+# =======================================================================
+async def archive_inactive_users(cutoff: datetime, batch_size: int) -> int:
+    return await _archive_inactive(
+        users_collection, users_archive_collection, "user_id", "last_seen", cutoff, batch_size
+    )
+
+async def archive_inactive_groups(cutoff: datetime, batch_size: int) -> int:
+    return await _archive_inactive(
+        groups_collection, groups_archive_collection, "chat_id", "last_active", cutoff, batch_size
+    )
+
+async def _archive_inactive(collection, archive, key: str, field: str, cutoff: datetime, batch_size: int) -> int:
+    """Move one batch of documents with `field` older than `cutoff` to `archive`"""
+    # Keyed upserts make an interrupted sweep safe to repeat, and re-checking
+    # the cutoff on delete keeps entities touched mid-sweep live
+    query = {field: {"$lt": cutoff}}
+    docs = await collection.find(query).limit(batch_size).to_list(None)
+    if not docs:
+        return 0
+
+    await archive.bulk_write(
+        [ReplaceOne({key: doc[key]}, {k: v for k, v in doc.items() if k != "_id"}, upsert=True) for doc in docs],
+        ordered=False
+    )
+    result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}, **query})
+    return result.deleted_count
+
+
+# =======================================================================
+# Auto-delete settings and tracked messages
+# =======================================================================
+async def init_group_auto_delete_settings(chat_id: int):
+    """Initialize auto-delete settings for a group with default values"""
+    if chat_id in initialized_chats or not auto_delete_migrated():
+        return
+    try:
+        result = await _guarded(lambda: auto_delete_settings_collection.update_one(
+            {"chat_id": chat_id},
+            {"$setOnInsert": {
+                "enabled": False,
+                "delete_after": DEFAULT_DELETE_AFTER
+            }},
+            upsert=True
+        ))
+    except DatabaseUnavailable:
+        # Idempotent, so the next message in the group will retry it
+        return
+    initialized_chats.add(chat_id)
+    if result.upserted_id is not None:
+        logger.info(f"Initialized auto-delete settings for group {chat_id}")
+
+async def get_auto_delete_settings(chat_id: int) -> dict:
+    """Get `enabled` and `delete_after` for a group in one read"""
+    try:
+        settings = await _guarded(
+            lambda: auto_delete_settings_collection.find_one({"chat_id": chat_id}, SETTINGS_PROJECTION)
+        )
+        if settings is None and not auto_delete_migrated():
+            # Not migrated yet, so the group's settings may still be legacy ones
+            settings = await _guarded(lambda: legacy_auto_delete_collection.find_one(
+                {"chat_id": chat_id, "type": {"$ne": "message"}}, SETTINGS_PROJECTION
+            ))
+    except DatabaseUnavailable:
+        metrics.inc("db_reads_cached")
+        settings = settings_cache.get(chat_id)
+    settings = settings or {}
+    settings = {
+        "enabled": settings.get("enabled", False),
+        "delete_after": settings.get("delete_after", DEFAULT_DELETE_AFTER)
+    }
+    settings_cache.set(chat_id, settings)
+    return settings
+
+async def is_auto_delete_enabled(chat_id: int):
+    """Check if auto-delete is enabled for a group"""
+    return (await get_auto_delete_settings(chat_id))["enabled"]
+
+async def get_auto_delete_time(chat_id: int):
+    """Get auto-delete time in seconds for a group"""
+    return (await get_auto_delete_settings(chat_id))["delete_after"]
+
+async def toggle_auto_delete(chat_id: int, state: bool = None):
+    """Toggle auto-delete status for a group"""
+    if state is None:
+        new_state = not await is_auto_delete_enabled(chat_id)
+    else:
+        new_state = state
+
+    await auto_delete_settings_collection.update_one(
+        {"chat_id": chat_id},
+        {
+            "$set": {"enabled": new_state},
+            "$setOnInsert": {"delete_after": DEFAULT_DELETE_AFTER}
+        },
+        upsert=True
+    )
+    settings_cache.set(chat_id, None)
+    logger.info(f"Auto-delete toggled to {new_state} for group {chat_id}")
+    return new_state
+
+async def set_auto_delete_time(chat_id: int, seconds: int):
+    """Set auto-delete time in seconds for a group"""
+    await auto_delete_settings_collection.update_one(
+        {"chat_id": chat_id},
+        {
+            "$set": {"delete_after": seconds},
+            "$setOnInsert": {"enabled": False}
+        },
+        upsert=True
+    )
+    settings_cache.set(chat_id, None)
+    minutes = seconds // 60
+    logger.info(f"Auto-delete time set to {minutes} minutes for group {chat_id}")
+    return seconds
+
+async def add_pending_deletion(chat_id: int, message_id: int, delete_at: float):
+    doc = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "delete_at": delete_at
+    }
+    await _write_or_journal(
+        lambda: pending_deletions_collection.insert_one(dict(doc)),
+        f"pending:{chat_id}:{message_id}", "add_pending_deletion", doc
+    )
+
+async def get_due_deletions(now: float, limit: int = 0) -> List[dict]:
+    """Tracked messages due by `now`, oldest `delete_at` first"""
+    query = {"delete_at": {"$lte": now}}
+    projection = {"_id": 1, "chat_id": 1, "message_id": 1}
+    cursor = pending_deletions_collection.find(query, projection).sort("delete_at", ASCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(None)
+
+async def count_due_deletions(now: float) -> int:
+    return await pending_deletions_collection.count_documents({"delete_at": {"$lte": now}})
+
+async def drop_expired_deletions(cutoff: float) -> int:
+    """Stop tracking messages that were due before `cutoff`, without deleting them"""
+    result = await pending_deletions_collection.delete_many({"delete_at": {"$lt": cutoff}})
+    return result.deleted_count
+
+async def remove_pending_deletions(ids: List):
+    if ids:
+        await pending_deletions_collection.delete_many({"_id": {"$in": ids}})
+
+# Namespaces whose legacy `auto_delete` collection has been split; until then
+# groups aren't given default settings, which would hide their legacy ones
+_auto_delete_migrated = set()
+
+def auto_delete_migrated() -> bool:
+    return current_namespace.get() in _auto_delete_migrated
+
+async def migrate_auto_delete(batch_size: int = 1000):
+    """One-time split of the legacy `auto_delete` collection into settings and pending stores.
+
+    Settings go first, since live groups wait on them. Every batch is removed
+    from the legacy collection once copied, so an interrupted run resumes
+    where it stopped; at worst one batch of pending rows is copied twice,
+    which only repeats a deletion.
+    """
+    settings = pending = 0
+    while True:
+        batch = await legacy_auto_delete_collection.find({"type": {"$ne": "message"}}).to_list(batch_size)
+        if not batch:
+            break
+        # $setOnInsert keeps settings an admin changed while the migration ran
+        await auto_delete_settings_collection.bulk_write([
+            UpdateOne(
+                {"chat_id": doc["chat_id"]},
+                {"$setOnInsert": {
+                    "enabled": doc.get("enabled", False),
+                    "delete_after": doc.get("delete_after", DEFAULT_DELETE_AFTER)
+                }},
+                upsert=True
+            )
+            for doc in batch
+        ], ordered=False)
+        await legacy_auto_delete_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        settings += len(batch)
+
+    while True:
+        batch = await legacy_auto_delete_collection.find({"type": "message"}).to_list(batch_size)
+        if not batch:
+            break
+        await pending_deletions_collection.insert_many([
+            {"chat_id": doc["chat_id"], "message_id": doc["message_id"], "delete_at": doc["delete_at"]}
+            for doc in batch
+        ], ordered=False)
+        await legacy_auto_delete_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        pending += len(batch)
+
+    _auto_delete_migrated.add(current_namespace.get())
+    if settings or pending:
+        logger.info(f"Migrated auto-delete data: {settings} group settings, {pending} pending messages")
+
+
+# =======================================================================
+# Chat feature gates
+# =======================================================================
+async def get_chat_features(chat_id: int) -> dict:
+    """Watcher feature gates of a group, see CHAT_FEATURE_DEFAULTS"""
+    features = chat_features_cache.get(chat_id)
+    if features is not None:
+        return features
+    try:
+        doc = await _guarded(
+            lambda: chat_features_collection.find_one({"chat_id": chat_id}, {"_id": 0, "chat_id": 0})
+        )
+    except DatabaseUnavailable:
+        # Not cached, so the next message asks MongoDB again
+        metrics.inc("db_reads_cached")
+        return dict(CHAT_FEATURE_DEFAULTS)
+    features = {**CHAT_FEATURE_DEFAULTS, **(doc or {})}
+    chat_features_cache.set(chat_id, features)
+    return features
+
+async def set_chat_feature(chat_id: int, name: str, enabled: bool) -> dict:
+    """Switch one feature gate of a group and return all of them"""
+    if name not in CHAT_FEATURE_DEFAULTS:
+        raise ValueError(f"unknown chat feature: {name}")
+    await chat_features_collection.update_one(
+        {"chat_id": chat_id}, {"$set": {name: enabled}}, upsert=True
+    )
+    features = {**await get_chat_features(chat_id), name: enabled}
+    chat_features_cache.set(chat_id, features)
+    logger.info(f"Feature {name} set to {enabled} for group {chat_id}")
+    return features
+
+
+# =======================================================================
+# Broadcast sessions
+# =======================================================================
+async def save_broadcast(broadcast_id: str, data: dict, ttl: float):
+    """Upsert draft fields; MongoDB drops the draft `ttl` seconds after its last save"""
+    # TTL indexes compare against UTC
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    await broadcast_collection.update_one(
+        {"broadcast_id": broadcast_id},
+        {"$set": {**data, "expires_at": expires_at}},
+        upsert=True
+    )
+
+async def get_broadcast(broadcast_id: str):
+    return await broadcast_collection.find_one({"broadcast_id": broadcast_id}, {"_id": 0, "expires_at": 0})
+
+async def delete_broadcast(broadcast_id: str):
+    await broadcast_collection.delete_one({"broadcast_id": broadcast_id})
+
+async def save_broadcast_result(result: dict):
+    await broadcast_history_collection.insert_one(result)
+
+async def add_scheduled_broadcast(scheduled: dict):
+    await scheduled_broadcasts_collection.insert_one(scheduled)
+
+async def get_scheduled_broadcasts() -> List[dict]:
+    cursor = scheduled_broadcasts_collection.find({}, {"_id": 0}).sort("run_at", ASCENDING)
+    return await cursor.to_list(None)
+
+async def get_due_scheduled_broadcasts(now: datetime) -> List[dict]:
+    cursor = scheduled_broadcasts_collection.find({"run_at": {"$lte": now}}, {"_id": 0})
+    return await cursor.to_list(None)
+
+async def reschedule_broadcast(broadcast_id: str, run_at: datetime):
+    await scheduled_broadcasts_collection.update_one(
+        {"broadcast_id": broadcast_id},
+        {"$set": {"run_at": run_at}}
+    )
+
+async def delete_scheduled_broadcast(broadcast_id: str) -> bool:
+    result = await scheduled_broadcasts_collection.delete_one({"broadcast_id": broadcast_id})
+    return result.deleted_count > 0
+
+
+# =======================================================================
+# Group activity analytics
+# =======================================================================
+async def flush_group_activity(buckets: dict):
+    """Add in-memory counters keyed by (chat_id, hour) to their hourly documents"""
+    await group_activity_collection.bulk_write(
+        [
+            UpdateOne({"chat_id": chat_id, "hour": hour}, {"$inc": dict(counts)}, upsert=True)
+            for (chat_id, hour), counts in buckets.items() if counts
+        ],
+        ordered=False
+    )
+
+async def get_top_groups(since: datetime, limit: int, field: str = "messages") -> List[dict]:
+    """Groups with the highest `field` total since `since`, with their titles"""
+    pipeline = [
+        {"$match": {"hour": {"$gte": since}}},
+        {"$group": {
+            "_id": "$chat_id",
+            "messages": {"$sum": "$messages"},
+            "afk_notices": {"$sum": "$afk_notices"},
+            "mentions": {"$sum": "$mentions"},
+            "db_ops": {"$sum": "$db_ops"},
+            "api_calls": {"$sum": "$api_calls"},
+        }},
+        {"$sort": {field: -1}},
+        {"$limit": limit},
+    ]
+    top = await group_activity_collection.aggregate(pipeline).to_list(None)
+    titles = {
+        group["chat_id"]: group.get("title")
+        async for group in groups_collection.find(
+            {"chat_id": {"$in": [row["_id"] for row in top]}}, {"_id": 0, "chat_id": 1, "title": 1}
+        )
+    }
+    for row in top:
+        row["chat_id"] = row.pop("_id")
+        row["title"] = titles.get(row["chat_id"])
+    return top
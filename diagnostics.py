@@ -0,0 +1,109 @@
+import asyncio
+import cProfile
+import io
+import pstats
+import time
+from collections import deque
+
+# Only one profiler can be attached to the loop thread at a time
+_profiling = False
+
+
+def profile_running() -> bool:
+    return _profiling
+
+
+async def profile_loop(seconds: float, limit: int = 40) -> str:
+    """Profile the event loop thread for `seconds` and return a pstats report"""
+    global _profiling
+    if _profiling:
+        raise RuntimeError("a profile is already running")
+
+    profiler = cProfile.Profile()
+    _profiling = True
+    started = time.monotonic()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        _profiling = False
+    elapsed = time.monotonic() - started
+
+    out = io.StringIO()
+    out.write(f"Event loop profile over {elapsed:.1f}s\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    out.write("\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(limit)
+    return out.getvalue()
+
+
+def _task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", repr(coro))
+    state = "done" if task.done() else "pending"
+    return f"{task.get_name()} [{name}] {state}"
+
+
+def dump_tasks() -> str:
+    """Every live asyncio task with its current stack"""
+    current = asyncio.current_task()
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+
+    out = io.StringIO()
+    out.write(f"{len(tasks)} live tasks\n")
+    for task in tasks:
+        out.write("\n" + "=" * 70 + "\n")
+        out.write(_task_label(task) + (" (this dump)" if task is current else "") + "\n")
+        task.print_stack(file=out)
+    return out.getvalue()
+
+
+# Recent callbacks that blocked the loop: (wall time, description, seconds)
+slow_callbacks = deque(maxlen=20)
+
+
+def describe_callback(handle: asyncio.Handle) -> str:
+    """Name the code a loop callback ran, following a task's await chain"""
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if not isinstance(task, asyncio.Task):
+        return getattr(callback, "__qualname__", repr(callback))
+
+    names = []
+    coro = task.get_coro()
+    while asyncio.iscoroutine(coro) and hasattr(coro, "cr_await") and len(names) < 6:
+        names.append(coro.__qualname__)
+        coro = coro.cr_await
+    return " > ".join(names)
+
+
+def install_slow_callback_detector(threshold: float, on_slow):
+    """Time every loop callback and call `on_slow(name, seconds)` past `threshold`.
+
+    Wraps `Handle._run`, which is what asyncio's own debug mode times, but
+    without the rest of debug mode's overhead.
+    """
+    original = asyncio.Handle._run
+    if getattr(original, "_slow_callback_detector", False):
+        return
+
+    def _run(self):
+        started = time.perf_counter()
+        original(self)
+        duration = time.perf_counter() - started
+        if duration >= threshold:
+            name = describe_callback(self)
+            slow_callbacks.append((time.time(), name, duration))
+            on_slow(name, duration)
+
+    _run._slow_callback_detector = True
+    asyncio.Handle._run = _run
+
+
+async def measure_loop_lag(interval: float) -> float:
+    """Sleep `interval` seconds and return how late the loop woke us"""
+    started = time.perf_counter()
+    await asyncio.sleep(interval)
+    return max(0.0, time.perf_counter() - started - interval)
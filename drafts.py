@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+
+from config import BROADCAST_DRAFT_TTL, BROADCAST_DRAFT_PERSIST
+from database import save_broadcast, get_broadcast, delete_broadcast
+from namespaces import PerNamespace
+
+logger = logging.getLogger(__name__)
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Broadcast draft persistence failed: {task.exception()}")
+
+
+class DraftStore:
+    """Broadcast drafts kept in memory until `ttl` seconds after their last change.
+
+    With `persist` set, every change is also written to MongoDB in the
+    background, and drafts missing from memory (after a restart) are loaded
+    from there.
+    """
+
+    def __init__(self, ttl: float, persist: bool):
+        self.ttl = ttl
+        self.persist = persist
+        self.drafts = {}  # draft_id -> [expires at, data]
+
+    def _expire(self):
+        now = time.monotonic()
+        for draft_id in [d for d, (expires, _) in self.drafts.items() if expires <= now]:
+            del self.drafts[draft_id]
+
+    def _persist(self, coro):
+        """Run a MongoDB write without making the button tap wait for it"""
+        asyncio.create_task(coro).add_done_callback(_log_failure)
+
+    async def create(self, draft_id: str, data: dict):
+        self._expire()
+        self.drafts[draft_id] = [time.monotonic() + self.ttl, data]
+        if self.persist:
+            self._persist(save_broadcast(draft_id, dict(data), self.ttl))
+
+    async def get(self, draft_id: str):
+        entry = self.drafts.get(draft_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self.drafts.pop(draft_id, None)
+
+        if not self.persist:
+            return None
+        data = await get_broadcast(draft_id)
+        if data:
+            self.drafts[draft_id] = [time.monotonic() + self.ttl, data]
+        return data
+
+    async def update(self, draft_id: str, **fields):
+        """Change draft fields and restart its TTL"""
+        entry = self.drafts.get(draft_id)
+        if entry is None:
+            return
+        entry[0] = time.monotonic() + self.ttl
+        entry[1].update(fields)
+        if self.persist:
+            self._persist(save_broadcast(draft_id, fields, self.ttl))
+
+    async def delete(self, draft_id: str):
+        self.drafts.pop(draft_id, None)
+        if self.persist:
+            await delete_broadcast(draft_id)
+
+
+drafts = PerNamespace(lambda namespace: DraftStore(BROADCAST_DRAFT_TTL, BROADCAST_DRAFT_PERSIST))
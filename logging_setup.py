@@ -0,0 +1,113 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_RATE_LIMIT, LOG_RATE_WINDOW
+
+# Digits and hex IDs differ per recipient, so they are ignored when grouping repeats
+_VARIABLE_PARTS = re.compile(r"0x[0-9a-fA-F]+|-?\d+")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `limit` similar records per `window` seconds.
+
+    Records are similar when they share logger, level and message text with
+    numbers stripped. The first record after a window with drops carries the
+    number of records suppressed.
+    """
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> [window start, seen, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.limit or record.levelno < logging.WARNING:
+            return True
+
+        key = (record.name, record.levelno, _VARIABLE_PARTS.sub("#", str(record.msg)))
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self.buckets[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                    record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+                if len(self.buckets) > 10_000:
+                    self._prune(now)
+                return True
+            bucket[1] += 1
+            if bucket[1] <= self.limit:
+                return True
+            bucket[2] += 1
+            return False
+
+    def _prune(self, now: float):
+        for key in [k for k, b in self.buckets.items() if now - b[0] >= self.window]:
+            del self.buckets[key]
+
+
+class _LoopSafeQueueHandler(QueueHandler):
+    """Queue handler that keeps the traceback separate for the JSON formatter"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> QueueListener:
+    """Route all logging through a queue drained by a listener thread"""
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    handler = _LoopSafeQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_WINDOW))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
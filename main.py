@@ -1,3 +1,4 @@
+import io
 import os
 import time
 import re
@@ -6,7 +7,8 @@ import asyncio
 import threading
 import random
 import string
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 from flask import Flask
 from pyrogram import Client, filters, enums, idle
 from pyrogram.types import (
@@ -14,38 +16,175 @@ from pyrogram.types import (
     InlineKeyboardMarkup, 
     InlineKeyboardButton, 
     InputMediaPhoto,
-    CallbackQuery
+    InputMediaVideo,
+    InputMediaAudio,
+    InputMediaDocument,
+    CallbackQuery,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent
+)
+from pyrogram.errors import (
+    PeerIdInvalid,
+    ChatAdminRequired,
+    FloodWait,
+    UserIsBlocked,
+    UserIsBot,
+    InputUserDeactivated,
+    ChatWriteForbidden,
+    ChatForbidden,
+    ChannelPrivate,
+    ChannelInvalid,
+    ChatIdInvalid,
+    UserBannedInChannel,
 )
-from motor.motor_asyncio import AsyncIOMotorClient
-from pyrogram.errors import PeerIdInvalid, ChatAdminRequired
 
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
+from config import (
+    BOT_TOKEN,
+    API_ID,
+    API_HASH,
+    BOT_TOKENS,
+    BOT_USERNAME,
+    OWNER_ID,
+    PORT,
+    SESSION_STORAGE,
+    SESSION_DIR,
+    SESSION_SYNC_INTERVAL,
+    AUTO_DELETE_BATCH_SIZE,
+    AUTO_DELETE_CONCURRENCY,
+    AUTO_DELETE_CATCHUP_THRESHOLD,
+    BROADCAST_ACTIVITY_WINDOWS,
+    BROADCAST_PROGRESS_INTERVAL,
+    BROADCAST_OFFPEAK_HOUR,
+    BROADCAST_SPREAD_WINDOW,
+    USER_RETENTION_DAYS,
+    GROUP_RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    RETENTION_BATCH_SIZE,
+    MAX_UPDATE_AGE,
+    HANDLER_WORKERS,
+    UPDATE_ORDERING,
+    MAX_PENDING_UPDATES,
+    LOOP_LAG_INTERVAL,
+    SLOW_CALLBACK_MS,
+    LOOP_LAG_ALERT_MS,
+    LOOP_LAG_ALERT_SAMPLES,
+    LOOP_LAG_ALERT_COOLDOWN,
+    DB_JOURNAL_REPLAY_INTERVAL,
+    DB_JOURNAL_BATCH_SIZE,
+    SNAPSHOT_PATH,
+    SNAPSHOT_INTERVAL,
+    ANALYTICS_FLUSH_INTERVAL,
+    SEEN_FLUSH_INTERVAL,
+    AFK_INLINE_CACHE_TIME,
+    AFK_INDEX_REFRESH,
 )
-logger = logging.getLogger(__name__)
+from database import (
+    add_afk,
+    is_afk,
+    get_many_afk,
+    remove_afk,
+    count_afk_users,
+    add_user,
+    flush_seen_users,
+    flush_seen_groups,
+    count_users,
+    get_all_user_ids,
+    track_group,
+    count_groups,
+    get_all_groups,
+    mark_users_dead,
+    record_user_soft_failures,
+    clear_user_soft_failures,
+    revive_user,
+    mark_groups_dead,
+    archive_inactive_users,
+    archive_inactive_groups,
+    init_group_auto_delete_settings,
+    get_auto_delete_settings,
+    get_auto_delete_time,
+    toggle_auto_delete,
+    set_auto_delete_time,
+    add_pending_deletion,
+    get_due_deletions,
+    count_due_deletions,
+    drop_expired_deletions,
+    remove_pending_deletions,
+    count_broadcast_audience,
+    save_broadcast_result,
+    add_scheduled_broadcast,
+    get_scheduled_broadcasts,
+    get_due_scheduled_broadcasts,
+    reschedule_broadcast,
+    delete_scheduled_broadcast,
+    sessions_collection,
+    ensure_indexes,
+    migrate_auto_delete,
+    get_chat_features,
+    set_chat_feature,
+    CHAT_FEATURE_DEFAULTS,
+    pending_journal_writes,
+    replay_journal,
+    flush_journal,
+    flush_group_activity,
+    get_top_groups,
+    load_afk_index,
+    save_hot_state,
+    load_hot_state,
+    get_indexed_afk,
+)
+from session_storage import make_storage
+from update_queue import OrderedUpdateQueue
+from logging_setup import setup_logging
+from outbound import outbound, PRIORITY_INTERACTIVE, PRIORITY_BROADCAST, PRIORITY_DELETION
+from drafts import drafts
+import metrics
+import diagnostics
+import analytics
+from analytics import track_chat
+from namespaces import PerNamespace, current_namespace
 
-# Get environment variables
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-API_ID = int(os.getenv("API_ID"))
-API_HASH = os.getenv("API_HASH")
-BOT_USERNAME = os.getenv("BOT_USERNAME")
-MONGODB_URI = os.getenv("MONGODB_URI")
-OWNER_ID = int(os.getenv("OWNER_ID", 0))
-PORT = int(os.getenv("PORT", 8080))
+# Configure logging
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Bot start time for uptime calculation
 START_TIME = time.time()
 
-# Initialize MongoDB
-mongo_client = AsyncIOMotorClient(MONGODB_URI)
-db = mongo_client.afk_db
-afk_collection = db.afk
-users_collection = db.users  # For user stats
-groups_collection = db.groups  # For tracking groups
-broadcast_collection = db.broadcast_tmp  # For temporary broadcast data
-auto_delete_collection = db.auto_delete  # For auto-delete settings and messages
+# Bots can only delete group messages up to 48 hours old
+TELEGRAM_DELETE_WINDOW = 48 * 3600
+DELETE_CHUNK_SIZE = 100  # message IDs per delete_messages call
+
+# Seconds between retries of the boot-time migration while MongoDB is down
+DB_SETUP_RETRY_INTERVAL = 60
+
+# Send errors meaning the recipient can never be reached again
+DEAD_USER_ERRORS = (UserIsBlocked, UserIsBot, InputUserDeactivated)
+DEAD_GROUP_ERRORS = (
+    ChatWriteForbidden,
+    ChatForbidden,
+    ChannelPrivate,
+    ChannelInvalid,
+    ChatIdInvalid,
+    UserBannedInChannel,
+)
+DEAD_FLUSH_EVERY = 500  # recipients between bulk dead-flag writes
+
+# Broadcast timing choices in the menu; the recurring ones repeat on these intervals
+SCHEDULE_CHOICES = ["now", "offpeak", "daily", "weekly"]
+# "/bcast at HH:MM ..." adds a one-off run at that local time to the choices
+SCHEDULE_AT_PATTERN = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+REPEAT_INTERVALS = {"daily": timedelta(days=1), "weekly": timedelta(days=7)}
+SCHEDULE_POLL_INTERVAL = 30  # seconds
+
+TOP_GROUP_FIELDS = ("messages", "afk_notices", "mentions", "db_ops", "api_calls")
+
+# Telegram usernames; anything else can't be looked up or used in a result id
+USERNAME_PATTERN = re.compile(r"^[A-Za-z0-9_]{4,32}$")
+
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 120
+LOOP_LAG_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
 
 # Helper functions
 def get_readable_time(seconds: int) -> str:
@@ -66,157 +205,94 @@ def get_readable_time(seconds: int) -> str:
 def generate_random_id(length=8):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
 
-async def add_afk(user_id: int, details: dict):
-    await afk_collection.update_one(
-        {"user_id": user_id},
-        {"$set": details},
-        upsert=True
-    )
-
-async def is_afk(user_id: int):
-    data = await afk_collection.find_one({"user_id": user_id})
-    if data:
-        return True, data
-    return False, {}
-
-async def remove_afk(user_id: int):
-    await afk_collection.delete_one({"user_id": user_id})
-
-async def add_user(user_id: int):
-    await users_collection.update_one(
-        {"user_id": user_id},
-        {"$set": {"last_seen": datetime.now()}},
-        upsert=True
-    )
-
-async def count_users():
-    return await users_collection.count_documents({})
-
-async def count_afk_users():
-    return await afk_collection.count_documents({})
-
-# Track groups
-async def track_group(chat_id: int, chat_title: str):
-    await groups_collection.update_one(
-        {"chat_id": chat_id},
-        {"$set": {
-            "title": chat_title,
-            "last_active": datetime.now()
-        }},
-        upsert=True
-    )
-
-async def count_groups():
-    return await groups_collection.count_documents({})
-
-async def get_all_groups():
-    groups = []
-    async for group in groups_collection.find({}):
-        groups.append(group)
-    return groups
-
 # =======================================================================
 # Auto-delete feature implementation (Per Group Settings)
 # =======================================================================
-async def init_group_auto_delete_settings(chat_id: int):
-    """Initialize auto-delete settings for a group with default values"""
-    settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    if not settings:
-        await auto_delete_collection.insert_one({
-            "type": "group_settings",
-            "chat_id": chat_id,
-            "enabled": False,
-            "delete_after": 300  # 5 minutes in seconds (default)
-        })
-        logger.info(f"Initialized auto-delete settings for group {chat_id}")
-
-async def is_auto_delete_enabled(chat_id: int):
-    """Check if auto-delete is enabled for a group"""
-    settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    if settings:
-        return settings.get("enabled", False)
-    return False
-
-async def get_auto_delete_time(chat_id: int):
-    """Get auto-delete time in seconds for a group"""
-    settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    if settings:
-        return settings.get("delete_after", 300)  # 5 minutes default
-    return 300
-
-async def toggle_auto_delete(chat_id: int, state: bool = None):
-    """Toggle auto-delete status for a group"""
-    settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    if not settings:
-        await init_group_auto_delete_settings(chat_id)
-        settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    
-    if state is None:
-        new_state = not settings["enabled"]
-    else:
-        new_state = state
-        
-    await auto_delete_collection.update_one(
-        {"chat_id": chat_id},
-        {"$set": {"enabled": new_state}}
-    )
-    logger.info(f"Auto-delete toggled to {new_state} for group {chat_id}")
-    return new_state
-
-async def set_auto_delete_time(chat_id: int, seconds: int):
-    """Set auto-delete time in seconds for a group"""
-    await auto_delete_collection.update_one(
-        {"chat_id": chat_id},
-        {"$set": {"delete_after": seconds}},
-        upsert=True
-    )
-    minutes = seconds // 60
-    logger.info(f"Auto-delete time set to {minutes} minutes for group {chat_id}")
-    return seconds
-
 async def track_message_for_deletion(message: Message):
     """Track a message for future deletion based on group settings"""
-    if not message.chat or message.chat.type not in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
+    # None when the reply was dropped by the outbound scheduler
+    if not message or not message.chat or message.chat.type not in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
         return
         
     chat_id = message.chat.id
     
-    if not await is_auto_delete_enabled(chat_id):
+    settings = await get_auto_delete_settings(chat_id)
+    if not settings["enabled"]:
         return
         
-    delete_after = await get_auto_delete_time(chat_id)
-    delete_at = time.time() + delete_after
-    
-    await auto_delete_collection.insert_one({
-        "type": "message",
-        "message_id": message.id,
-        "chat_id": chat_id,
-        "delete_at": delete_at
-    })
+    delete_at = time.time() + settings["delete_after"]
+    
+    await add_pending_deletion(chat_id, message.id, delete_at)
     logger.debug(f"Tracking message for deletion: {message.id} in chat {chat_id}")
 
+async def delete_chat_messages(chat_id: int, message_ids: list):
+    """Delete tracked messages in one chat, up to 100 per API call"""
+    for i in range(0, len(message_ids), DELETE_CHUNK_SIZE):
+        chunk = message_ids[i:i + DELETE_CHUNK_SIZE]
+        try:
+            await outbound.call(chat_id, PRIORITY_DELETION, app.delete_messages, chat_id, chunk)
+            metrics.inc("auto_delete_deleted", len(chunk))
+        except Exception as e:
+            metrics.inc("auto_delete_failed", len(chunk))
+            logger.error(f"Failed to delete messages in chat {chat_id}: {e}")
+
+async def process_deletion_batch(batch: list):
+    """Delete a batch of due messages, chats in parallel and each chat in order"""
+    by_chat = defaultdict(list)
+    for msg in batch:
+        by_chat[msg["chat_id"]].append(msg["message_id"])
+    
+    semaphore = asyncio.Semaphore(AUTO_DELETE_CONCURRENCY)
+    
+    async def worker(chat_id, message_ids):
+        async with semaphore:
+            await delete_chat_messages(chat_id, message_ids)
+    
+    await asyncio.gather(*(worker(chat_id, ids) for chat_id, ids in by_chat.items()))
+    
+    # Remove from tracking regardless of success
+    await remove_pending_deletions([msg["_id"] for msg in batch])
+
 async def auto_delete_loop():
     """Background task to delete expired messages"""
     logger.info("Auto-delete task started")
     while True:
         try:
-            # Process messages due for deletion
             current_time = time.time()
-            query = {"type": "message", "delete_at": {"$lte": current_time}}
-            messages_to_delete = await auto_delete_collection.find(query).to_list(None)
             
-            if messages_to_delete:
-                logger.info(f"Found {len(messages_to_delete)} messages to delete")
-                
-            for msg in messages_to_delete:
-                try:
-                    await app.delete_messages(msg["chat_id"], msg["message_id"])
-                    logger.debug(f"Deleted message: {msg['message_id']} in chat {msg['chat_id']}")
-                except Exception as e:
-                    logger.error(f"Failed to delete message: {e}")
-                finally:
-                    # Remove from tracking regardless of success
-                    await auto_delete_collection.delete_one({"_id": msg["_id"]})
+            # Telegram refuses to delete messages past the 48h window, drop them without API calls
+            dropped = await drop_expired_deletions(current_time - TELEGRAM_DELETE_WINDOW)
+            if dropped:
+                metrics.inc("auto_delete_dropped_expired", dropped)
+                logger.info(f"Dropped {dropped} tracked messages past the deletion window")
+            
+            backlog = await count_due_deletions(current_time)
+            metrics.set_gauge(namespaced("auto_delete_backlog"), backlog)
+            
+            catch_up = backlog >= AUTO_DELETE_CATCHUP_THRESHOLD
+            if catch_up:
+                logger.info(f"Auto-delete catch-up started: {backlog} overdue messages")
+            elif backlog:
+                logger.info(f"Found {backlog} messages to delete")
+            
+            # Stream the backlog oldest first, one batch at a time
+            started = time.time()
+            processed = 0
+            while True:
+                batch = await get_due_deletions(current_time, limit=AUTO_DELETE_BATCH_SIZE)
+                if not batch:
+                    break
+                await process_deletion_batch(batch)
+                processed += len(batch)
+                metrics.set_gauge(namespaced("auto_delete_backlog"), max(backlog - processed, 0))
+                if catch_up:
+                    logger.info(f"Auto-delete catch-up: {processed}/{backlog} processed")
+            
+            if catch_up:
+                logger.info(
+                    f"Auto-delete catch-up finished: {processed} messages "
+                    f"in {get_readable_time(int(time.time() - started))}"
+                )
             
             # Sleep before next check
             await asyncio.sleep(30)
@@ -224,12 +300,170 @@ async def auto_delete_loop():
             logger.error(f"Error in auto-delete loop: {e}")
             await asyncio.sleep(60)
 
+async def retention_loop():
+    """Background task to archive users and groups inactive past the retention window"""
+    if not USER_RETENTION_DAYS and not GROUP_RETENTION_DAYS:
+        return
+    logger.info("Retention task started")
+    sweeps = [
+        ("users", USER_RETENTION_DAYS, archive_inactive_users),
+        ("groups", GROUP_RETENTION_DAYS, archive_inactive_groups),
+    ]
+    while True:
+        try:
+            for name, days, archive in sweeps:
+                if not days:
+                    continue
+                cutoff = datetime.now() - timedelta(days=days)
+                moved = 0
+                while True:
+                    batch = await archive(cutoff, RETENTION_BATCH_SIZE)
+                    moved += batch
+                    if batch < RETENTION_BATCH_SIZE:
+                        break
+                    await asyncio.sleep(1)  # Leave room for live traffic between batches
+                if moved:
+                    metrics.inc(f"retention_archived_{name}", moved)
+                    logger.info(f"Archived {moved} {name} inactive for over {days} days")
+        except Exception as e:
+            logger.error(f"Error in retention loop: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+async def session_sync_loop():
+    """Background task to persist the session peer cache periodically"""
+    if SESSION_STORAGE == "memory":
+        return
+    logger.info("Session sync task started")
+    while True:
+        await asyncio.sleep(SESSION_SYNC_INTERVAL)
+        try:
+            if app.is_connected:
+                await app.storage.save()
+        except Exception as e:
+            logger.error(f"Error in session sync loop: {e}")
+
+async def afk_index_loop():
+    """Background task to load the in-memory AFK index and resync it periodically"""
+    while True:
+        try:
+            count = await load_afk_index()
+            metrics.set_gauge(namespaced("afk_index_size"), count)
+        except Exception as e:
+            logger.error(f"Error loading AFK index: {e}")
+        await asyncio.sleep(AFK_INDEX_REFRESH)
+
+async def database_setup_loop():
+    """Background task to create indexes and migrate legacy data once MongoDB is reachable"""
+    indexed = migrated = False
+    while True:
+        # Indexes first: the migration's settings upserts rely on them
+        if not indexed:
+            indexed = await ensure_indexes()
+        if not migrated:
+            try:
+                await migrate_auto_delete()
+                migrated = True
+            except Exception as e:
+                logger.error(f"Auto-delete migration failed: {e}")
+        if indexed and migrated:
+            return
+        logger.info(f"Database setup incomplete, retrying in {DB_SETUP_RETRY_INTERVAL}s")
+        await asyncio.sleep(DB_SETUP_RETRY_INTERVAL)
+
+async def snapshot_loop():
+    """Background task to save the warm-start snapshot periodically"""
+    if not SNAPSHOT_PATH or not SNAPSHOT_INTERVAL:
+        return
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_hot_state()
+        except Exception as e:
+            logger.error(f"Error saving warm-start snapshot: {e}")
+
+async def analytics_flush_loop():
+    """Background task to write in-memory group activity counters to MongoDB"""
+    while True:
+        await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+        buckets = analytics.take()
+        if not buckets:
+            continue
+        try:
+            await flush_group_activity(buckets)
+        except Exception as e:
+            # Keep the counts for the next flush
+            analytics.restore(buckets)
+            logger.error(f"Error flushing group activity: {e}")
+
+async def seen_flush_loop():
+    """Background task to write last activity for the users and groups seen since the last run"""
+    while True:
+        await asyncio.sleep(SEEN_FLUSH_INTERVAL)
+        for name, flush in (("users", flush_seen_users), ("groups", flush_seen_groups)):
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"Error flushing seen {name}: {e}")
+
+async def journal_replay_loop():
+    """Background task to push writes journaled during a MongoDB outage"""
+    while True:
+        await asyncio.sleep(DB_JOURNAL_REPLAY_INTERVAL)
+        if not pending_journal_writes():
+            continue
+        try:
+            replayed = 0
+            while True:
+                batch = await replay_journal(DB_JOURNAL_BATCH_SIZE)
+                replayed += batch
+                if batch < DB_JOURNAL_BATCH_SIZE:
+                    break
+            if replayed:
+                logger.info(f"Replayed {replayed} journaled writes to MongoDB")
+        except Exception as e:
+            logger.error(f"Error in journal replay loop: {e}")
+
+def report_slow_callback(name: str, seconds: float):
+    """Called from the event loop after a callback blocked it too long"""
+    metrics.inc("slow_callbacks")
+    logger.warning(f"Slow callback took {seconds * 1000:.0f}ms: {name}")
+
+async def loop_lag_loop():
+    """Background task to sample event loop lag and alert the owner when it stays high"""
+    if SLOW_CALLBACK_MS:
+        diagnostics.install_slow_callback_detector(SLOW_CALLBACK_MS / 1000, report_slow_callback)
+    logger.info("Loop lag monitor started")
+    high_samples = 0
+    last_alert = 0.0
+    while True:
+        lag_ms = await diagnostics.measure_loop_lag(LOOP_LAG_INTERVAL) * 1000
+        metrics.observe("loop_lag_ms", lag_ms, LOOP_LAG_BUCKETS_MS)
+        metrics.set_gauge("loop_lag_ms", round(lag_ms, 1))
+        
+        high_samples = high_samples + 1 if lag_ms > LOOP_LAG_ALERT_MS else 0
+        if (high_samples < LOOP_LAG_ALERT_SAMPLES or not OWNER_ID
+                or time.time() - last_alert < LOOP_LAG_ALERT_COOLDOWN):
+            continue
+        last_alert = time.time()
+        
+        slow = "\n".join(
+            f"• `{seconds * 1000:.0f}ms` {name}"
+            for _, name, seconds in list(diagnostics.slow_callbacks)[-5:]
+        ) or "none recorded"
+        try:
+            await outbound.call(
+                OWNER_ID, PRIORITY_INTERACTIVE, app.send_message, OWNER_ID,
+                f"⚠️ **Event loop lagging**\n"
+                f"Over {LOOP_LAG_ALERT_MS}ms for {high_samples} samples, last `{lag_ms:.0f}ms`\n\n"
+                f"Recent slow callbacks:\n{slow}"
+            )
+        except Exception as e:
+            logger.error(f"Loop lag alert failed: {e}")
+
 # Helper function to generate auto-delete menu for a group
 async def get_auto_delete_menu(chat_id: int):
-    settings = await auto_delete_collection.find_one({"chat_id": chat_id})
-    if not settings:
-        await init_group_auto_delete_settings(chat_id)
-        settings = await auto_delete_collection.find_one({"chat_id": chat_id})
+    await init_group_auto_delete_settings(chat_id)
+    settings = await get_auto_delete_settings(chat_id)
     
     enabled = settings["enabled"]
     delete_after = settings["delete_after"]
@@ -276,20 +510,41 @@ flask_app = Flask(__name__)
 def home():
     return "AFK Bot is running! 🚀", 200
 
+@flask_app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": "text/plain; charset=utf-8"}
+
 def run_flask():
     flask_app.run(host='0.0.0.0', port=PORT)
 
 # Bot initialization
 class Bot(Client):
-    def __init__(self):
+    def __init__(self, token: str = BOT_TOKEN, namespace: str = ""):
         super().__init__(
-            "afk_bot",
+            f"afk_bot_{namespace}" if namespace else "afk_bot",
             api_id=API_ID,
             api_hash=API_HASH,
-            bot_token=BOT_TOKEN,
-            in_memory=True
+            bot_token=token,
+            workdir=SESSION_DIR,
+            in_memory=(SESSION_STORAGE == "memory"),
+            workers=HANDLER_WORKERS
+        )
+        self.namespace = namespace
+        self.registered_handlers = []
+        # Keeps afk_handler and afk_watcher runs for one user from racing
+        if UPDATE_ORDERING in ("user", "chat"):
+            self.dispatcher.updates_queue = OrderedUpdateQueue(UPDATE_ORDERING)
+        # Keep auth key and peer cache across restarts
+        self.storage = make_storage(
+            SESSION_STORAGE, self.name, SESSION_DIR,
+            sessions_collection.for_namespace(namespace)
         )
     
+    def add_handler(self, handler, group: int = 0):
+        # Remembered so the bots from BOT_TOKENS can register the same handlers
+        self.registered_handlers.append((handler, group))
+        return super().add_handler(handler, group)
+    
     async def start(self):
         await super().start()
         logger.info("Bot client started successfully")
@@ -297,10 +552,11 @@ class Bot(Client):
         # Send startup notification to owner
         if OWNER_ID:
             try:
-                await self.send_message(
+                await outbound.call(
+                    OWNER_ID, PRIORITY_INTERACTIVE, self.send_message,
                     OWNER_ID,
                     "✅ AFK Bot Started Successfully!\n"
-                    f"🤖 Username: @{BOT_USERNAME}"
+                    f"🤖 Username: @{self.me.username}"
                 )
             except Exception as e:
                 logger.error(f"Startup notification failed: {e}")
@@ -309,13 +565,43 @@ class Bot(Client):
         await super().stop()
         logger.info("Bot client stopped")
 
-app = Bot()
+# One client per token; the extra ones are keyed by their namespace, which
+# also names their database
+bots = {"": Bot()}
+for token in BOT_TOKENS:
+    namespace = f"bot{token.split(':')[0]}"
+    bots[namespace] = Bot(token, namespace)
+
+# The bot whose update or background task is running
+app = PerNamespace(bots.__getitem__)
+
+def bot_username() -> str:
+    return app.me.username if app.me else BOT_USERNAME
+
+def namespaced(name: str) -> str:
+    """Metric `name` for the current bot; gauges would otherwise be overwritten by each bot"""
+    namespace = current_namespace.get()
+    return f"{name}_{namespace}" if namespace else name
 
 # Track bot start time for uptime
 BOT_START_TIME = time.time()
 
+def should_skip_reply(message: Message) -> bool:
+    """True if `message` is too old or the update queue too deep to answer"""
+    pending = app.dispatcher.updates_queue.qsize()
+    metrics.set_gauge(namespaced("updates_pending"), pending)
+    
+    if MAX_UPDATE_AGE and message.date and time.time() - message.date.timestamp() > MAX_UPDATE_AGE:
+        metrics.inc("updates_stale")
+        return True
+    if MAX_PENDING_UPDATES and pending > MAX_PENDING_UPDATES:
+        metrics.inc("updates_shed")
+        return True
+    return False
+
 # Track when bot is added to a group
 @app.on_message(filters.new_chat_members)
+@track_chat
 async def new_chat_members(_, message: Message):
     if message.new_chat_members:
         for member in message.new_chat_members:
@@ -328,64 +614,42 @@ async def new_chat_members(_, message: Message):
                 # Initialize auto-delete settings for this new group
                 await init_group_auto_delete_settings(message.chat.id)
 
-# Start command handler with new image and message
-@app.on_message(filters.command(["start", "help"]))
-async def start_command(_, message: Message):
-    user = message.from_user
-    uptime = get_readable_time(int(time.time() - BOT_START_TIME))
-    
-    # Track group if in a group
-    if message.chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
-        await track_group(
-            message.chat.id,
-            message.chat.title
-        )
-        # Initialize auto-delete settings if not exists
-        await init_group_auto_delete_settings(message.chat.id)
-    
-    # Add user to database for stats
-    if user:
-        await add_user(user.id)
-    
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "➕ Add to Group ➕",
-                    url=f"https://t.me/{BOT_USERNAME}?startgroup=true",
-                )
-            ],
-            [
-                InlineKeyboardButton("Help ❓", callback_data="help"),
-                InlineKeyboardButton("Owner 👤", url="https://t.me/mr_rahul090"),
-            ],
-            [
-                InlineKeyboardButton("Support Group", url="https://t.me/team_secrat_bots")
-            ]
-        ]
-    )
-    
-    text = f"""
+# Start/help menu, built once per bot
+START_IMAGE = "https://i.ibb.co/kVYPDqRC/tmp5h-atl08.jpg"
+
+START_TEXT = """
 Hello! I'm AFK BOT.
 
 Active since {uptime}
 
 Use /help for more info.
 """
-    
-    # Send photo with caption and buttons
-    sent_msg = await message.reply_photo(
-        photo="https://i.ibb.co/kVYPDqRC/tmp5h-atl08.jpg",
-        caption=text,
-        reply_markup=keyboard
-    )
-    await track_message_for_deletion(sent_msg)
 
-# Help callback handler
-@app.on_callback_query(filters.regex("^help$"))
-async def help_callback(_, query):
-    await query.answer()
-    help_text = """
+start_keyboards = {}  # bot username -> start keyboard
+
+def get_start_keyboard() -> InlineKeyboardMarkup:
+    username = bot_username()
+    if username not in start_keyboards:
+        start_keyboards[username] = InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "➕ Add to Group ➕",
+                        url=f"https://t.me/{username}?startgroup=true",
+                    )
+                ],
+                [
+                    InlineKeyboardButton("Help ❓", callback_data="help"),
+                    InlineKeyboardButton("Owner 👤", url="https://t.me/mr_rahul090"),
+                ],
+                [
+                    InlineKeyboardButton("Support Group", url="https://t.me/team_secrat_bots")
+                ]
+            ]
+        )
+    return start_keyboards[username]
+
+HELP_TEXT = """
 **📖 AFK Bot Guide**
 
 **To set AFK:**
@@ -405,59 +669,98 @@ async def help_callback(_, query):
 **Other Commands:**
 - /stats - Show bot statistics
 - /autodel - Configure auto-delete settings for this group (Admins only)
+- /features - Choose which AFK notices this group gets (Admins only)
 """
+
+HELP_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]]
+)
+
+# Telegram file_id of the start image per bot (file IDs are only valid for
+# the bot that uploaded them), set after the first upload so the image is not
+# fetched from the external URL again
+start_photo_file_ids = {}
+
+def get_start_photo() -> str:
+    return start_photo_file_ids.get(current_namespace.get(), START_IMAGE)
+
+def get_start_text() -> str:
+    uptime = get_readable_time(int(time.time() - BOT_START_TIME))
+    return START_TEXT.format(uptime=uptime)
+
+def cache_start_photo(sent_msg: Message):
+    namespace = current_namespace.get()
+    if namespace not in start_photo_file_ids and sent_msg and sent_msg.photo:
+        start_photo_file_ids[namespace] = sent_msg.photo.file_id
+
+# Start command handler with new image and message
+@app.on_message(filters.command(["start", "help"]))
+async def start_command(_, message: Message):
+    user = message.from_user
     
-    await query.message.edit_text(
-        help_text,
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("🔙 Back", callback_data="back_to_start")]]
-        ),
+    # Track group if in a group
+    if message.chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
+        await track_group(
+            message.chat.id,
+            message.chat.title
+        )
+        # Initialize auto-delete settings if not exists
+        await init_group_auto_delete_settings(message.chat.id)
+    
+    # Add user to database for stats
+    if user:
+        await add_user(user.id)
+        # A private /start means broadcasts can reach this user again
+        if message.chat.type == enums.ChatType.PRIVATE:
+            await revive_user(user.id)
+    
+    # Send photo with caption and buttons
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE,
+        message.reply_photo,
+        photo=get_start_photo(),
+        caption=get_start_text(),
+        reply_markup=get_start_keyboard()
+    )
+    cache_start_photo(sent_msg)
+    await track_message_for_deletion(sent_msg)
+
+# Help callback handler
+@app.on_callback_query(filters.regex("^help$"))
+async def help_callback(_, query):
+    await query.answer()
+    await outbound.call(
+        query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, HELP_TEXT, reply_markup=HELP_KEYBOARD
     )
 
 # Back to start callback handler
 @app.on_callback_query(filters.regex("^back_to_start$"))
 async def back_callback(_, query):
     await query.answer()
-    user = query.from_user
-    uptime = get_readable_time(int(time.time() - BOT_START_TIME))
-    
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "➕ Add to Group ➕",
-                    url=f"https://t.me/{BOT_USERNAME}?startgroup=true",
-                )
-            ],
-            [
-                InlineKeyboardButton("Help ❓", callback_data="help"),
-                InlineKeyboardButton("Owner 👤", url="https://t.me/mr_rahul090"),
-            ],
-            [
-                InlineKeyboardButton("Support Group", url="https://t.me/team_secrat_bots")
-            ]
-        ]
-    )
     
-    text = f"""
-Hello! I'm AFK BOT.
-
-Active since {uptime}
-
-Use /help for more info.
-"""
+    # Only the caption changes if the start photo is still attached
+    if query.message.photo:
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_caption,
+            get_start_text(),
+            reply_markup=get_start_keyboard()
+        )
+        return
     
     # Edit message with photo
-    await query.message.edit_media(
+    sent_msg = await outbound.call(
+        query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_media,
         media=InputMediaPhoto(
-            media="https://i.ibb.co/kVYPDqRC/tmp5h-atl08.jpg",
-            caption=text
+            media=get_start_photo(),
+            caption=get_start_text()
         ),
-        reply_markup=keyboard
+        reply_markup=get_start_keyboard()
     )
+    cache_start_photo(sent_msg)
 
 # AFK handler
 @app.on_message(filters.command(["afk"], prefixes=["/", "!"]) | filters.regex(r"^brb\b", re.IGNORECASE))
+@track_chat
 async def afk_handler(_, message: Message):
     if message.sender_chat:
         return
@@ -477,6 +780,9 @@ async def afk_handler(_, message: Message):
     # Add user to database for stats
     await add_user(user_id)
     
+    # Backlog after a restart: apply the command but don't answer it
+    skip_reply = should_skip_reply(message)
+    
     # Extract command and reason from message
     if message.text and message.text.lower().startswith("brb"):
         parts = message.text.split(" ", 1)
@@ -487,41 +793,11 @@ async def afk_handler(_, message: Message):
     # User is returning from AFK
     if verifier:
         await remove_afk(user_id)
-        try:
-            afktype = reasondb["type"]
-            timeafk = reasondb["time"]
-            data = reasondb["data"]
-            reasonafk = reasondb["reason"]
-            seenago = get_readable_time((int(time.time() - timeafk)))
-            
-            # Always show reason if it exists
-            base_text = f"**{message.from_user.first_name}** is back online and was away for {seenago}"
-            if reasonafk and str(reasonafk).lower() != "none":
-                base_text += f"\n\nReason: `{reasonafk}`"
-            
-            if afktype == "animation":
-                sent_msg = await message.reply_animation(
-                    data,
-                    caption=base_text,
-                )
-            elif afktype == "photo":
-                sent_msg = await message.reply_photo(
-                    photo=f"downloads/{user_id}.jpg",
-                    caption=base_text,
-                )
-            else:
-                sent_msg = await message.reply_text(
-                    base_text,
-                    disable_web_page_preview=True,
-                )
-            await track_message_for_deletion(sent_msg)
-        except Exception as e:
-            logger.error(f"Error in AFK return: {e}")
-            sent_msg = await message.reply_text(
-                f"**{message.from_user.first_name}** is back online",
-                disable_web_page_preview=True,
-            )
-            await track_message_for_deletion(sent_msg)
+        if not skip_reply:
+            text_only = False
+            if message.chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
+                text_only = (await get_chat_features(message.chat.id))["text_only"]
+            await reply_back_online(message, reasondb, text_only=text_only)
         return
 
     # Setting new AFK status
@@ -552,7 +828,9 @@ async def afk_handler(_, message: Message):
             }
         except Exception as e:
             logger.error(f"Error downloading photo: {e}")
-            await message.reply_text("Failed to download media, using text AFK")
+            await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "Failed to download media, using text AFK"
+            )
     # Handle reply to media
     elif message.reply_to_message:
         if message.reply_to_message.animation:
@@ -574,7 +852,9 @@ async def afk_handler(_, message: Message):
                 }
             except Exception as e:
                 logger.error(f"Error downloading photo: {e}")
-                await message.reply_text("Failed to download media, using text AFK")
+                await outbound.call(
+                    message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "Failed to download media, using text AFK"
+                )
         elif (message.reply_to_message.sticker and 
               not message.reply_to_message.sticker.is_animated):
             try:
@@ -588,29 +868,111 @@ async def afk_handler(_, message: Message):
                 }
             except Exception as e:
                 logger.error(f"Error downloading sticker: {e}")
-                await message.reply_text("Failed to download media, using text AFK")
+                await outbound.call(
+                    message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "Failed to download media, using text AFK"
+                )
 
-    # Save AFK status to database
+    # Save AFK status to database, with the name inline lookups search by
+    details["username"] = message.from_user.username
+    details["first_name"] = message.from_user.first_name
     await add_afk(user_id, details)
+    if skip_reply:
+        return
     response = f"**{message.from_user.first_name}** is now AFK"
     if details["reason"]:
         response += f"\n\nReason: `{details['reason']}`"
-    sent_msg = await message.reply_text(response)
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, response
+    )
+    await track_message_for_deletion(sent_msg)
+
+async def reply_afk_notice(message: Message, user, reasondb: dict, text_only: bool = False):
+    """Reply that `user` is AFK, with their reason and media if set"""
+    afktype = "text" if text_only else reasondb["type"]
+    timeafk = reasondb["time"]
+    data = reasondb["data"]
+    reasonafk = reasondb["reason"]
+    seenago = get_readable_time((int(time.time() - timeafk)))
+    
+    # Always show reason if it exists
+    base_text = f"**{user.first_name}** is AFK since {seenago}"
+    if reasonafk and str(reasonafk).lower() != "none":
+        base_text += f"\n\nReason: `{reasonafk}`"
+    
+    if afktype == "animation":
+        sent_msg = await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE,
+            message.reply_animation, data, caption=base_text
+        )
+    elif afktype == "photo":
+        sent_msg = await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE,
+            message.reply_photo, photo=f"downloads/{user.id}.jpg", caption=base_text
+        )
+    else:
+        sent_msg = await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, base_text
+        )
     await track_message_for_deletion(sent_msg)
 
+async def reply_back_online(message: Message, reasondb: dict, text_only: bool = False):
+    """Reply that the sender is back, with how long they were AFK"""
+    user_name = message.from_user.first_name
+    try:
+        afktype = "text" if text_only else reasondb["type"]
+        timeafk = reasondb["time"]
+        data = reasondb["data"]
+        reasonafk = reasondb["reason"]
+        seenago = get_readable_time((int(time.time() - timeafk)))
+        
+        # Always show reason if it exists
+        base_text = f"**{user_name}** is back online and was away for {seenago}"
+        if reasonafk and str(reasonafk).lower() != "none":
+            base_text += f"\n\nReason: `{reasonafk}`"
+        
+        if afktype == "animation":
+            sent_msg = await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE,
+                message.reply_animation, data, caption=base_text
+            )
+        elif afktype == "photo":
+            sent_msg = await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE,
+                message.reply_photo, photo=f"downloads/{message.from_user.id}.jpg", caption=base_text
+            )
+        else:
+            sent_msg = await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE,
+                message.reply_text, base_text, disable_web_page_preview=True
+            )
+        await track_message_for_deletion(sent_msg)
+    except Exception as e:
+        logger.error(f"Error in AFK return: {e}")
+        sent_msg = await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE,
+            message.reply_text, f"**{user_name}** is back online", disable_web_page_preview=True
+        )
+        await track_message_for_deletion(sent_msg)
+
 # AFK watcher
 @app.on_message(
     filters.group & ~filters.bot & ~filters.me & ~filters.service,
     group=1
 )
+@track_chat
 async def afk_watcher(_, message: Message):
+    analytics.record(message.chat.id, messages=1)
     if not message.from_user:
         return
         
     userid = message.from_user.id
-    user_name = message.from_user.first_name
-
-    # Track group
+    
+    # Cached per group, see /features
+    features = await get_chat_features(message.chat.id)
+    
+    # Activity bookkeeping for every group, notices or not: broadcasts and
+    # retention rely on it. These are buffered or remembered in memory, so
+    # they cost no write per message
     await track_group(
         message.chat.id,
         message.chat.title
@@ -621,6 +983,9 @@ async def afk_watcher(_, message: Message):
     # Add user to database for stats
     await add_user(userid)
 
+    # Old or backlogged messages only update state; replies would be stale
+    skip_reply = should_skip_reply(message)
+
     # Check if user is returning from AFK
     verifier, reasondb = await is_afk(userid)
     if verifier:
@@ -631,235 +996,339 @@ async def afk_watcher(_, message: Message):
             
         # Remove AFK status and notify
         await remove_afk(userid)
-        try:
-            afktype = reasondb["type"]
-            timeafk = reasondb["time"]
-            data = reasondb["data"]
-            reasonafk = reasondb["reason"]
-            seenago = get_readable_time((int(time.time() - timeafk)))
-            
-            # Always show reason if it exists
-            base_text = f"**{user_name}** is back online and was away for {seenago}"
-            if reasonafk and str(reasonafk).lower() != "none":
-                base_text += f"\n\nReason: `{reasonafk}`"
-            
-            if afktype == "animation":
-                sent_msg = await message.reply_animation(
-                    data,
-                    caption=base_text,
-                )
-            elif afktype == "photo":
-                sent_msg = await message.reply_photo(
-                    photo=f"downloads/{userid}.jpg",
-                    caption=base_text,
-                )
-            else:
-                sent_msg = await message.reply_text(
-                    base_text,
-                    disable_web_page_preview=True,
-                )
-            await track_message_for_deletion(sent_msg)
-        except Exception as e:
-            logger.error(f"Error in AFK return watcher: {e}")
-            sent_msg = await message.reply_text(f"**{user_name}** is back online")
-            await track_message_for_deletion(sent_msg)
+        if not skip_reply and features["back_online_notices"]:
+            await reply_back_online(message, reasondb, text_only=features["text_only"])
 
-    # Check if replying to AFK user
-    if message.reply_to_message and message.reply_to_message.from_user:
-        try:
-            replied_user = message.reply_to_message.from_user
-            verifier, reasondb = await is_afk(replied_user.id)
-            
-            if verifier:
-                afktype = reasondb["type"]
-                timeafk = reasondb["time"]
-                data = reasondb["data"]
-                reasonafk = reasondb["reason"]
-                seenago = get_readable_time((int(time.time() - timeafk)))
-                
-                # Always show reason if it exists
-                base_text = f"**{replied_user.first_name}** is AFK since {seenago}"
-                if reasonafk and str(reasonafk).lower() != "none":
-                    base_text += f"\n\nReason: `{reasonafk}`"
-                
-                if afktype == "animation":
-                    sent_msg = await message.reply_animation(data, caption=base_text)
-                elif afktype == "photo":
-                    sent_msg = await message.reply_photo(
-                        photo=f"downloads/{replied_user.id}.jpg",
-                        caption=base_text
-                    )
-                else:
-                    sent_msg = await message.reply_text(base_text)
-                await track_message_for_deletion(sent_msg)
-        except Exception as e:
-            logger.error(f"Error in AFK reply watcher: {e}")
+    # Mention lookups cost API calls, so skip them too
+    if skip_reply:
+        return
+    if not (features["mention_notices"] or features["reply_notices"]):
+        return
 
-    # Check mentioned users
-    if message.entities and message.text:
+    # Collect replied and mentioned users, then look them up in one query
+    targets = {}
+    if features["reply_notices"] and message.reply_to_message and message.reply_to_message.from_user:
+        replied_user = message.reply_to_message.from_user
+        targets[replied_user.id] = replied_user
+
+    if features["mention_notices"] and message.entities and message.text:
         for entity in message.entities:
             if entity.type == enums.MessageEntityType.MENTION:
                 try:
                     mentioned_text = message.text[entity.offset:entity.offset + entity.length]
                     mentioned_username = mentioned_text[1:]
                     
-                    if mentioned_username.lower() == BOT_USERNAME.lower():
+                    if mentioned_username.lower() == bot_username().lower():
                         continue
                     
+                    analytics.record(message.chat.id, api_calls=1)
                     try:
                         user = await app.get_users(mentioned_username)
                     except PeerIdInvalid:
                         continue
+                    analytics.record(message.chat.id, mentions=1)
                         
                     if user.id == message.from_user.id:
                         continue
-                        
-                    verifier, reasondb = await is_afk(user.id)
-                    if verifier:
-                        afktype = reasondb["type"]
-                        timeafk = reasondb["time"]
-                        data = reasondb["data"]
-                        reasonafk = reasondb["reason"]
-                        seenago = get_readable_time((int(time.time() - timeafk)))
-                        
-                        # Always show reason if it exists
-                        base_text = f"**{user.first_name}** is AFK since {seenago}"
-                        if reasonafk and str(reasonafk).lower() != "none":
-                            base_text += f"\n\nReason: `{reasonafk}`"
-                        
-                        if afktype == "animation":
-                            sent_msg = await message.reply_animation(data, caption=base_text)
-                        elif afktype == "photo":
-                            sent_msg = await message.reply_photo(
-                                photo=f"downloads/{user.id}.jpg",
-                                caption=base_text
-                            )
-                        else:
-                            sent_msg = await message.reply_text(base_text)
-                        await track_message_for_deletion(sent_msg)
+                    
+                    targets.setdefault(user.id, user)
                 except Exception as e:
                     logger.error(f"Error handling mention: {e}")
                     
             elif entity.type == enums.MessageEntityType.TEXT_MENTION:
-                try:
-                    user = entity.user
-                    if user.id == message.from_user.id:
-                        continue
-                        
-                    verifier, reasondb = await is_afk(user.id)
-                    if verifier:
-                        afktype = reasondb["type"]
-                        timeafk = reasondb["time"]
-                        data = reasondb["data"]
-                        reasonafk = reasondb["reason"]
-                        seenago = get_readable_time((int(time.time() - timeafk)))
-                        
-                        # Always show reason if it exists
-                        base_text = f"**{user.first_name}** is AFK since {seenago}"
-                        if reasonafk and str(reasonafk).lower() != "none":
-                            base_text += f"\n\nReason: `{reasonafk}`"
-                        
-                        if afktype == "animation":
-                            sent_msg = await message.reply_animation(data, caption=base_text)
-                        elif afktype == "photo":
-                            sent_msg = await message.reply_photo(
-                                photo=f"downloads/{user.id}.jpg",
-                                caption=base_text
-                            )
-                        else:
-                            sent_msg = await message.reply_text(base_text)
-                        await track_message_for_deletion(sent_msg)
-                except Exception as e:
-                    logger.error(f"Error handling text mention: {e}")
+                user = entity.user
+                if user and user.id != message.from_user.id:
+                    analytics.record(message.chat.id, mentions=1)
+                    targets.setdefault(user.id, user)
+
+    if not targets:
+        return
+
+    afk_users = await get_many_afk(targets.keys())
+    for user_id, user in targets.items():
+        reasondb = afk_users.get(user_id)
+        if not reasondb:
+            continue
+        try:
+            await reply_afk_notice(message, user, reasondb, text_only=features["text_only"])
+            analytics.record(message.chat.id, afk_notices=1)
+        except Exception as e:
+            logger.error(f"Error in AFK mention watcher: {e}")
+
+# Inline "@bot username" AFK lookup, answered from the in-memory index
+@app.on_inline_query()
+async def afk_inline_query(_, query: InlineQuery):
+    username = query.query.strip().lstrip("@").split(" ")[0]
+    if not USERNAME_PATTERN.match(username):
+        await query.answer(
+            [], cache_time=AFK_INLINE_CACHE_TIME,
+            switch_pm_text="Type a username to check AFK status", switch_pm_parameter="inline"
+        )
+        return
+    
+    reasondb = get_indexed_afk(username=username)
+    if reasondb is None:
+        # AFK rows saved before usernames were stored: resolve from the local peer cache
+        try:
+            peer = await app.storage.get_peer_by_username(username.lower())
+            reasondb = get_indexed_afk(user_id=peer.user_id)
+        except Exception:
+            pass
+    
+    if reasondb:
+        name = reasondb.get("first_name") or f"@{username}"
+        seenago = get_readable_time(int(time.time() - reasondb["time"]))
+        text = f"**{name}** is AFK since {seenago}"
+        if reasondb.get("reason"):
+            text += f"\n\nReason: `{reasondb['reason']}`"
+        result = InlineQueryResultArticle(
+            title=f"💤 {name} is AFK",
+            description=f"Since {seenago}" + (f" • {reasondb['reason']}" if reasondb.get("reason") else ""),
+            input_message_content=InputTextMessageContent(text),
+            id=f"afk-{reasondb['user_id']}"
+        )
+    else:
+        result = InlineQueryResultArticle(
+            title=f"✅ @{username} is not AFK",
+            description="No AFK status set",
+            input_message_content=InputTextMessageContent(f"@{username} is not AFK"),
+            id=f"notafk-{username.lower()}"
+        )
+    
+    metrics.inc("inline_afk_queries")
+    await query.answer([result], cache_time=AFK_INLINE_CACHE_TIME)
+
+class BroadcastProgress:
+    """Counters for one broadcast run, shown on a throttled status message"""
+    
+    def __init__(self, status: Message, label: str, total: int):
+        self.status = status
+        self.label = label
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.pruned = 0
+        self.flood_wait = 0.0
+        self.started = time.monotonic()
+        self.last_edit = self.started
+    
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.skipped
+    
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+    
+    @property
+    def rate(self) -> float:
+        return self.done / self.elapsed if self.elapsed else 0.0
+    
+    def eta(self) -> str:
+        if not self.rate:
+            return "-"
+        return get_readable_time(int((self.total - self.done) / self.rate))
+    
+    def render(self) -> str:
+        return (
+            f"{self.label}: {self.done}/{self.total}\n"
+            f"• Sent: {self.sent} | Failed: {self.failed} | Skipped: {self.skipped}\n"
+            f"• Speed: {self.rate:.1f} msg/s | FloodWait: {int(self.flood_wait)}s\n"
+            f"• ETA: {self.eta()}"
+        )
+    
+    async def update(self, force: bool = False):
+        """Edit the status message at most once per BROADCAST_PROGRESS_INTERVAL"""
+        now = time.monotonic()
+        if not force and now - self.last_edit < BROADCAST_PROGRESS_INTERVAL:
+            return
+        self.last_edit = now
+        try:
+            await outbound.call(
+                self.status.chat.id, PRIORITY_BROADCAST, self.status.edit_text, self.render()
+            )
+        except FloodWait as e:
+            self.last_edit = now + e.value
+        except Exception as e:
+            logger.debug(f"Progress update failed: {e}")
+    
+    async def pace(self, spread: float):
+        """Sleep so that all recipients are reached evenly over `spread` seconds"""
+        if spread and self.total:
+            target = self.started + spread * self.done / self.total
+            await asyncio.sleep(max(0.0, target - time.monotonic()))
+    
+    def summary(self) -> dict:
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "pruned": self.pruned,
+            "flood_wait": round(self.flood_wait, 1),
+            "elapsed": round(self.elapsed, 1),
+            "rate": round(self.rate, 2),
+        }
+
+def album_media(album: list) -> list:
+    """InputMedia re-sending an album's files by file ID, with their captions"""
+    media = []
+    for msg in album:
+        # send_media_group parses captions rather than taking entities
+        caption = {"caption": msg.caption.html if msg.caption else "", "parse_mode": enums.ParseMode.HTML}
+        if msg.photo:
+            media.append(InputMediaPhoto(msg.photo.file_id, **caption))
+        elif msg.video:
+            media.append(InputMediaVideo(msg.video.file_id, **caption))
+        elif msg.audio:
+            media.append(InputMediaAudio(msg.audio.file_id, **caption))
+        elif msg.document:
+            media.append(InputMediaDocument(msg.document.file_id, **caption))
+    return media
+
+async def send_broadcast_message(chat_id: int, broadcast_type, text=None, replied_msg=None, progress=None,
+                                 priority=PRIORITY_BROADCAST, album=None):
+    """Send one broadcast through the outbound scheduler and return the sent messages.
+
+    `album` holds every message of the replied media group; it goes out in
+    one API call per recipient either way. Broadcasts are never dropped for
+    waiting too long on a rate limit, even the interactive current-chat copy.
+    """
+    def on_flood_wait(seconds):
+        if progress:
+            progress.flood_wait += seconds
+    
+    if text:
+        # Send text message
+        sent = await outbound.call(
+            chat_id, priority, app.send_message,
+            chat_id=chat_id, text=text, on_flood_wait=on_flood_wait, must_send=True
+        )
+        return [sent]
+    if album:
+        if broadcast_type == "bcast":
+            # Like copy_media_group, without fetching the album again per recipient
+            return await outbound.call(
+                chat_id, priority, app.send_media_group,
+                chat_id=chat_id,
+                media=album_media(album),
+                on_flood_wait=on_flood_wait,
+                must_send=True
+            )
+        # fcast
+        return await outbound.call(
+            chat_id, priority, app.forward_messages,
+            chat_id=chat_id,
+            from_chat_id=album[0].chat.id,
+            message_ids=[msg.id for msg in album],
+            on_flood_wait=on_flood_wait,
+            must_send=True
+        )
+    if replied_msg:
+        # Handle replied message
+        if broadcast_type == "bcast":
+            sent = await outbound.call(
+                chat_id, priority, app.copy_message,
+                chat_id=chat_id,
+                from_chat_id=replied_msg.chat.id,
+                message_id=replied_msg.id,
+                on_flood_wait=on_flood_wait,
+                must_send=True
+            )
+            return [sent]
+        # fcast
+        sent = await outbound.call(
+            chat_id, priority, app.forward_messages,
+            chat_id=chat_id,
+            from_chat_id=replied_msg.chat.id,
+            message_ids=replied_msg.id,
+            on_flood_wait=on_flood_wait,
+            must_send=True
+        )
+        return [sent]
+    return []
 
 # Helper function for user broadcasting
-async def broadcast_to_users(message, broadcast_type, text=None, replied_msg=None):
-    total = 0
-    success = 0
-    failed = 0
+async def broadcast_to_users(message, broadcast_type, text=None, replied_msg=None, active_since=None, spread=0,
+                             album=None):
+    dead = {}  # user_id -> error name, flagged in bulk
+    unresolved = []  # PeerIdInvalid, flagged after repeated failures
+    delivered = []  # Reached, so earlier PeerIdInvalid strikes are cleared
     
-    users = await users_collection.distinct("user_id")
-    total_users = len(users)
+    users = await get_all_user_ids(active_since)
     
-    status = await message.reply_text(f"📤 Broadcasting to {total_users} users...")
+    status = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"📤 Broadcasting to {len(users)} users...",
+        must_send=True
+    )
+    progress = BroadcastProgress(status, "👤 User broadcast", len(users))
     
     for user_id in users:
         try:
-            if text:
-                # Send text message
-                sent_msg = await app.send_message(chat_id=user_id, text=text)
-                await track_message_for_deletion(sent_msg)
-            elif replied_msg:
-                # Handle replied message
-                if broadcast_type == "bcast":
-                    sent_msg = await app.copy_message(
-                        chat_id=user_id,
-                        from_chat_id=replied_msg.chat.id,
-                        message_id=replied_msg.id
-                    )
-                else:  # fcast
-                    sent_msg = await app.forward_messages(
-                        chat_id=user_id,
-                        from_chat_id=replied_msg.chat.id,
-                        message_ids=replied_msg.id
-                    )
+            sent = await send_broadcast_message(
+                user_id, broadcast_type, text, replied_msg, progress, album=album
+            )
+            for sent_msg in sent:
                 await track_message_for_deletion(sent_msg)
-            success += 1
+            progress.sent += 1
+            delivered.append(user_id)
+        except DEAD_USER_ERRORS as e:
+            progress.failed += 1
+            dead[user_id] = type(e).__name__
+        except PeerIdInvalid:
+            progress.failed += 1
+            unresolved.append(user_id)
         except Exception as e:
-            failed += 1
+            progress.failed += 1
             logger.error(f"Failed to send to {user_id}: {e}")
         
-        total += 1
-        if total % 100 == 0:
-            await status.edit_text(f"👤 User broadcast: {total}/{total_users}")
-    
-    return total_users, success, failed, status
+        if progress.done % DEAD_FLUSH_EVERY == 0:
+            progress.pruned += await mark_users_dead(dead) + await record_user_soft_failures(unresolved)
+            await clear_user_soft_failures(delivered)
+            dead, unresolved, delivered = {}, [], []
+        await progress.update()
+        await progress.pace(spread)
+    
+    progress.pruned += await mark_users_dead(dead) + await record_user_soft_failures(unresolved)
+    await clear_user_soft_failures(delivered)
+    if progress.pruned:
+        logger.info(f"Flagged {progress.pruned} unreachable users")
+    
+    await progress.update(force=True)
+    return progress
 
 # Helper function for group broadcasting
-async def broadcast_to_groups(message, broadcast_type, text=None, replied_msg=None, exclude_chat_id=None, pin_message=False):
-    total = 0
-    success = 0
-    failed = 0
+async def broadcast_to_groups(message, broadcast_type, text=None, replied_msg=None, exclude_chat_id=None, pin_message=False, active_since=None, spread=0,
+                              album=None):
+    dead = {}  # chat_id -> error name, flagged in bulk
     
-    groups = await get_all_groups()
-    total_groups = len(groups)
+    groups = await get_all_groups(active_since)
     
-    status = await message.reply_text(f"📤 Broadcasting to {total_groups} groups...")
+    status = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"📤 Broadcasting to {len(groups)} groups...",
+        must_send=True
+    )
+    progress = BroadcastProgress(status, "👥 Group broadcast", len(groups))
     
     for group in groups:
         try:
             # Skip excluded chat
             if exclude_chat_id and group["chat_id"] == exclude_chat_id:
+                progress.skipped += 1
                 continue
                 
-            sent_msg = None
-            if text:
-                # Send text message
-                sent_msg = await app.send_message(
-                    chat_id=group["chat_id"],
-                    text=text
-                )
-            elif replied_msg:
-                # Handle replied message
-                if broadcast_type == "bcast":
-                    sent_msg = await app.copy_message(
-                        chat_id=group["chat_id"],
-                        from_chat_id=replied_msg.chat.id,
-                        message_id=replied_msg.id
-                    )
-                else:  # fcast
-                    sent_msg = await app.forward_messages(
-                        chat_id=group["chat_id"],
-                        from_chat_id=replied_msg.chat.id,
-                        message_ids=replied_msg.id
-                    )
+            sent = await send_broadcast_message(
+                group["chat_id"], broadcast_type, text, replied_msg, progress, album=album
+            )
             
             # Pin message in group if requested (only works in groups, not DMs)
-            if pin_message and sent_msg and group["chat_id"] < 0:  # Group IDs are negative
+            if pin_message and sent and group["chat_id"] < 0:  # Group IDs are negative
                 try:
-                    await app.pin_chat_message(
+                    await outbound.call(
+                        group["chat_id"], PRIORITY_BROADCAST, app.pin_chat_message,
                         chat_id=group["chat_id"],
-                        message_id=sent_msg.id
+                        message_id=sent[0].id
                     )
                 except ChatAdminRequired:
                     logger.warning(f"Bot lacks permission to pin in group {group['chat_id']}")
@@ -867,19 +1336,132 @@ async def broadcast_to_groups(message, broadcast_type, text=None, replied_msg=No
                     logger.error(f"Pin message failed in group {group['chat_id']}: {e}")
             
             # Track message for deletion if applicable
-            if sent_msg:
+            for sent_msg in sent:
                 await track_message_for_deletion(sent_msg)
             
-            success += 1
+            progress.sent += 1
+        except DEAD_GROUP_ERRORS as e:
+            progress.failed += 1
+            dead[group["chat_id"]] = type(e).__name__
         except Exception as e:
-            failed += 1
+            progress.failed += 1
             logger.error(f"Failed to send to group {group['chat_id']}: {e}")
-        
-        total += 1
-        if total % 10 == 0:
-            await status.edit_text(f"👥 Group broadcast: {total}/{total_groups}")
+        finally:
+            await progress.update()
+            await progress.pace(spread)
     
-    return total_groups, success, failed, status
+    progress.pruned = await mark_groups_dead(dead)
+    if progress.pruned:
+        logger.info(f"Flagged {progress.pruned} unreachable groups")
+    
+    await progress.update(force=True)
+    return progress
+
+def format_broadcast_stats(title: str, progress: BroadcastProgress) -> str:
+    return (
+        f"\n{title}\n"
+        f"• Total: {progress.total}\n"
+        f"• Successful: {progress.sent}\n"
+        f"• Failed: {progress.failed}\n"
+        f"• Skipped: {progress.skipped}\n"
+        f"• Removed (unreachable): {progress.pruned}\n"
+        f"• Speed: {progress.rate:.1f} msg/s in {get_readable_time(int(progress.elapsed))}\n"
+        f"• FloodWait: {int(progress.flood_wait)}s"
+    )
+
+def get_active_since(active_days: int):
+    """Start of the activity window, or None for everyone"""
+    if not active_days:
+        return None
+    return datetime.now() - timedelta(days=active_days)
+
+def format_active_days(active_days: int) -> str:
+    return f"last {active_days}d" if active_days else "All"
+
+def format_schedule(schedule: str, at_time: str = None) -> str:
+    hour = f"{BROADCAST_OFFPEAK_HOUR:02d}:00"
+    return {
+        "now": "Now",
+        "at": f"At {at_time}",
+        "offpeak": f"Next {hour}",
+        "daily": f"Daily {hour}",
+        "weekly": f"Weekly {hour}",
+    }[schedule]
+
+def schedule_choices(broadcast_data: dict) -> list:
+    """When a draft can be sent; a time given with /bcast adds the "at" choice"""
+    if broadcast_data.get("at_time"):
+        return ["now", "at", *SCHEDULE_CHOICES[1:]]
+    return SCHEDULE_CHOICES
+
+def next_run_at(broadcast_data: dict, after: datetime) -> datetime:
+    """First run of a scheduled draft: its chosen time or BROADCAST_OFFPEAK_HOUR:00, strictly after `after`"""
+    hour, minute = BROADCAST_OFFPEAK_HOUR, 0
+    if broadcast_data.get("schedule") == "at":
+        hour, minute = map(int, broadcast_data["at_time"].split(":"))
+    run_at = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run_at <= after:
+        run_at += timedelta(days=1)
+    return run_at
+
+# Helper function to generate the broadcast options menu
+async def get_broadcast_menu(broadcast_id: str, broadcast_data: dict):
+    options = broadcast_data.get("options", [])
+    active_days = broadcast_data.get("active_days", 0)
+    schedule = broadcast_data.get("schedule", "now")
+    
+    text = "🔔 **Broadcast Options**\n\n"
+    if broadcast_data.get("text"):
+        text += f"Message: {broadcast_data['text'][:100]}{'...' if len(broadcast_data['text']) > 100 else ''}\n\n"
+    elif broadcast_data.get("replied_msg_ids"):
+        text += f"Message: Album of {len(broadcast_data['replied_msg_ids'])} items\n\n"
+    elif broadcast_data.get("replied_msg_id"):
+        text += "Message: Replied content\n\n"
+    else:
+        text += "⚠️ No message content provided\n\n"
+    
+    # Audience estimate for the selected activity window, counted once per draft
+    estimates = broadcast_data.setdefault("audience", {})
+    if str(active_days) not in estimates:
+        estimates[str(active_days)] = await count_broadcast_audience(get_active_since(active_days))
+    user_count, group_count = estimates[str(active_days)]
+    
+    text += "**Selected Options:**\n"
+    text += f"- 📍 Pin: {'✅' if 'pin' in options else '❌'}\n"
+    text += f"- 👥 Group: {'✅' if 'group' in options else '❌'} (~{group_count})\n"
+    text += f"- 👤 User: {'✅' if 'user' in options else '❌'} (~{user_count})\n"
+    text += f"- 🕒 Active: {format_active_days(active_days)}\n"
+    text += f"- ⏰ When: {format_schedule(schedule, broadcast_data.get('at_time'))}\n\n"
+    text += "Select options:"
+    
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("📍 Pin", callback_data=f"broadcast_option:{broadcast_id}:pin"),
+            InlineKeyboardButton("👥 Group", callback_data=f"broadcast_option:{broadcast_id}:group")
+        ],
+        [
+            InlineKeyboardButton("👤 User", callback_data=f"broadcast_option:{broadcast_id}:user"),
+            InlineKeyboardButton(
+                f"🕒 Active: {format_active_days(active_days)}",
+                callback_data=f"broadcast_option:{broadcast_id}:active"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                f"⏰ When: {format_schedule(schedule, broadcast_data.get('at_time'))}",
+                callback_data=f"broadcast_option:{broadcast_id}:schedule"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                "🚀 Send Now" if schedule == "now" else "⏰ Schedule",
+                callback_data=f"broadcast_confirm:{broadcast_id}"
+            ),
+            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_cancel:{broadcast_id}")
+        ]
+    ])
+    
+    return text, keyboard
 
 # Broadcast command with inline options
 @app.on_message(filters.command(["bcast", "fcast"]) & filters.user(OWNER_ID))
@@ -898,53 +1480,44 @@ async def broadcast_menu(_, message: Message):
     text_content = None
     replied_msg = None
     
+    # "/bcast at HH:MM ..." offers sending at that time
+    args = message.command[1:]
+    at_time = None
+    if len(args) >= 2 and args[0].lower() == "at" and SCHEDULE_AT_PATTERN.match(args[1]):
+        hour, minute = map(int, args[1].split(":"))
+        at_time = f"{hour:02d}:{minute:02d}"
+        args = args[2:]
+    
+    album_ids = None
     if message.reply_to_message:
         replied_msg = message.reply_to_message
-    elif message.text and len(message.command) > 1:
+        # Albums are sent whole, whichever of their messages was replied to
+        if replied_msg.media_group_id:
+            album = await app.get_media_group(replied_msg.chat.id, replied_msg.id)
+            album_ids = [msg.id for msg in album]
+    elif message.text and args:
         # Remove command and join the rest
-        text_content = " ".join(message.command[1:])
+        text_content = " ".join(args)
     
     # Save broadcast data temporarily
-    await broadcast_collection.update_one(
-        {"broadcast_id": broadcast_id},
-        {"$set": {
-            "command": message.command[0].lower(),
-            "text": text_content,
-            "replied_msg_id": replied_msg.id if replied_msg else None,
-            "replied_chat_id": replied_msg.chat.id if replied_msg else None,
-            "original_chat_id": message.chat.id,
-            "original_msg_id": message.id,
-            "timestamp": datetime.now()
-        }},
-        upsert=True
-    )
-    
-    # Create inline keyboard with the requested options
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("📍 Pin", callback_data=f"broadcast_option:{broadcast_id}:pin"),
-            InlineKeyboardButton("👥 Group", callback_data=f"broadcast_option:{broadcast_id}:group")
-        ],
-        [
-            InlineKeyboardButton("👤 User", callback_data=f"broadcast_option:{broadcast_id}:user")
-        ],
-        [
-            InlineKeyboardButton("🚀 Send Now", callback_data=f"broadcast_confirm:{broadcast_id}"),
-            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_cancel:{broadcast_id}")
-        ]
-    ])
-    
-    text = "🔔 **Broadcast Options**\n\n"
-    if text_content:
-        text += f"Message: {text_content[:100]}{'...' if len(text_content) > 100 else ''}\n\n"
-    elif replied_msg:
-        text += "Message: Replied content\n\n"
-    else:
-        text += "⚠️ No message content provided\n\n"
+    broadcast_data = {
+        "command": message.command[0].lower(),
+        "text": text_content,
+        "replied_msg_id": replied_msg.id if replied_msg else None,
+        "replied_chat_id": replied_msg.chat.id if replied_msg else None,
+        "replied_msg_ids": album_ids,
+        "original_chat_id": message.chat.id,
+        "original_msg_id": message.id,
+        "at_time": at_time,
+        "schedule": "at" if at_time else "now",
+        "timestamp": datetime.now()
+    }
+    await drafts.create(broadcast_id, broadcast_data)
     
-    text += "Select options:"
+    text, keyboard = await get_broadcast_menu(broadcast_id, broadcast_data)
     
-    sent_msg = await message.reply_text(
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text,
         text,
         reply_markup=keyboard
     )
@@ -959,138 +1532,132 @@ async def broadcast_option_handler(_, query: CallbackQuery):
     option = data[2]
     
     # Get current broadcast data
-    broadcast_data = await broadcast_collection.find_one({"broadcast_id": broadcast_id})
+    broadcast_data = await drafts.get(broadcast_id)
     if not broadcast_data:
-        await query.message.edit_text("❌ Broadcast session expired or invalid")
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, "❌ Broadcast session expired or invalid"
+        )
+        return
+    
+    # Cycle the activity window
+    if option == "active":
+        windows = BROADCAST_ACTIVITY_WINDOWS
+        current = broadcast_data.get("active_days", 0)
+        next_days = windows[(windows.index(current) + 1) % len(windows)] if current in windows else windows[0]
+        await drafts.update(broadcast_id, active_days=next_days)
+        text, keyboard = await get_broadcast_menu(broadcast_id, broadcast_data)
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, text, reply_markup=keyboard
+        )
+        return
+    
+    # Cycle when to send
+    if option == "schedule":
+        current = broadcast_data.get("schedule", "now")
+        choices = schedule_choices(broadcast_data)
+        next_schedule = choices[(choices.index(current) + 1) % len(choices)]
+        await drafts.update(broadcast_id, schedule=next_schedule)
+        text, keyboard = await get_broadcast_menu(broadcast_id, broadcast_data)
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, text, reply_markup=keyboard
+        )
         return
     
     # Toggle option
-    current_options = broadcast_data.get("options", [])
+    current_options = list(broadcast_data.get("options", []))
     if option in current_options:
         current_options.remove(option)
     else:
         current_options.append(option)
     
-    # Update database
-    await broadcast_collection.update_one(
-        {"broadcast_id": broadcast_id},
-        {"$set": {"options": current_options}}
-    )
+    await drafts.update(broadcast_id, options=current_options)
     
-    # Update message text to show selected options
-    text = "🔔 **Broadcast Options**\n\n"
-    if broadcast_data.get("text"):
-        text += f"Message: {broadcast_data['text'][:100]}{'...' if len(broadcast_data['text']) > 100 else ''}\n\n"
-    elif broadcast_data.get("replied_msg_id"):
-        text += "Message: Replied content\n\n"
-    else:
-        text += "⚠️ No message content provided\n\n"
-    
-    text += "**Selected Options:**\n"
-    text += f"- 📍 Pin: {'✅' if 'pin' in current_options else '❌'}\n"
-    text += f"- 👥 Group: {'✅' if 'group' in current_options else '❌'}\n"
-    text += f"- 👤 User: {'✅' if 'user' in current_options else '❌'}\n\n"
-    text += "Select options:"
-    
-    # Create updated keyboard
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("📍 Pin", callback_data=f"broadcast_option:{broadcast_id}:pin"),
-            InlineKeyboardButton("👥 Group", callback_data=f"broadcast_option:{broadcast_id}:group")
-        ],
-        [
-            InlineKeyboardButton("👤 User", callback_data=f"broadcast_option:{broadcast_id}:user")
-        ],
-        [
-            InlineKeyboardButton("🚀 Send Now", callback_data=f"broadcast_confirm:{broadcast_id}"),
-            InlineKeyboardButton("❌ Cancel", callback_data=f"broadcast_cancel:{broadcast_id}")
-        ]
-    ])
+    text, keyboard = await get_broadcast_menu(broadcast_id, broadcast_data)
     
-    await query.message.edit_text(text, reply_markup=keyboard)
+    await outbound.call(
+        query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, text, reply_markup=keyboard
+    )
 
-# Callback handler for broadcast confirmation
-@app.on_callback_query(filters.regex(r"^broadcast_confirm:(\w+)$"))
-async def broadcast_confirm_handler(_, query: CallbackQuery):
-    await query.answer()
-    broadcast_id = query.data.split(":")[1]
-    
-    # Get broadcast data
-    broadcast_data = await broadcast_collection.find_one({"broadcast_id": broadcast_id})
-    if not broadcast_data:
-        await query.message.edit_text("❌ Broadcast session expired or invalid")
-        return
-    
+async def run_broadcast(broadcast_id: str, broadcast_data: dict, status_msg: Message, spread: float = 0,
+                        current_chat: bool = True):
+    """Send a broadcast draft everywhere it targets and return the result text and keyboard.
+    
+    `spread` is shared by the group and user legs, so the whole run fits in it.
+    Scheduled runs pass `current_chat=False`: the chat the draft came from only
+    gets a copy when the owner sends it right away.
+    """
     # Get selected options
     options = broadcast_data.get("options", [])
+    legs = sum(1 for leg in ("group", "user") if leg in options)
+    leg_spread = spread / legs if legs else 0
     command = broadcast_data["command"]
     chat_id = broadcast_data["original_chat_id"]
+    active_since = get_active_since(broadcast_data.get("active_days", 0))
+    
+    # Fetch the replied message or album once, then reuse it for every
+    # recipient; without it there would be nothing to send
+    replied_msg = None
+    album = None
+    try:
+        if broadcast_data.get("replied_msg_ids"):
+            album = await app.get_messages(
+                broadcast_data["replied_chat_id"],
+                broadcast_data["replied_msg_ids"]
+            )
+            album = [msg for msg in album if msg and not msg.empty]
+            if not album:
+                return "❌ **Broadcast aborted**\n\nThe album to send was deleted", None
+        elif broadcast_data.get("replied_msg_id"):
+            replied_msg = await app.get_messages(
+                broadcast_data["replied_chat_id"],
+                broadcast_data["replied_msg_id"]
+            )
+            if not replied_msg or replied_msg.empty:
+                return "❌ **Broadcast aborted**\n\nThe message to send was deleted", None
+    except Exception as e:
+        logger.error(f"Fetching broadcast {broadcast_id} message failed: {e}")
+        return f"❌ **Broadcast aborted**\n\nCould not fetch the message to send: {e}", None
     
     # Send in current group if applicable
     current_msg = None
-    replied_msg = None
-    if broadcast_data.get("text") or broadcast_data.get("replied_msg_id"):
+    if current_chat and (broadcast_data.get("text") or broadcast_data.get("replied_msg_id")):
         try:
-            if broadcast_data.get("text"):
-                # Send text message
-                current_msg = await app.send_message(
-                    chat_id=chat_id,
-                    text=broadcast_data["text"]
-                )
-                await track_message_for_deletion(current_msg)
-            elif broadcast_data.get("replied_msg_id"):
-                # Get the replied message object
-                replied_msg = await app.get_messages(
-                    broadcast_data["replied_chat_id"],
-                    broadcast_data["replied_msg_id"]
-                )
-                
-                # Send replied message
-                if command == "bcast":
-                    current_msg = await app.copy_message(
-                        chat_id=chat_id,
-                        from_chat_id=replied_msg.chat.id,
-                        message_id=replied_msg.id
-                    )
-                else:  # fcast
-                    current_msg = await app.forward_messages(
-                        chat_id=chat_id,
-                        from_chat_id=replied_msg.chat.id,
-                        message_ids=replied_msg.id
-                    )
-                await track_message_for_deletion(current_msg)
+            sent = await send_broadcast_message(
+                chat_id,
+                command,
+                text=broadcast_data.get("text"),
+                replied_msg=replied_msg,
+                priority=PRIORITY_INTERACTIVE,
+                album=album
+            )
+            current_msg = sent[0] if sent else None
+            for sent_msg in sent:
+                await track_message_for_deletion(sent_msg)
         except Exception as e:
             logger.error(f"Current chat broadcast failed: {e}")
-            await query.message.edit_text(f"❌ Failed to send in current chat: {e}")
+            await outbound.call(
+                status_msg.chat.id, PRIORITY_INTERACTIVE, status_msg.edit_text, f"❌ Failed to send in current chat: {e}"
+            )
     
     # Broadcast to groups if requested
     group_success = False
     group_stats = ""
+    results = {}
     if "group" in options:
         try:
-            if broadcast_data.get("text"):
-                total_groups, success, failed, status = await broadcast_to_groups(
-                    query.message, 
-                    command,
-                    text=broadcast_data["text"],
-                    exclude_chat_id=chat_id,  # Exclude current chat
-                    pin_message=("pin" in options)
-                )
-            else:
-                total_groups, success, failed, status = await broadcast_to_groups(
-                    query.message, 
-                    command,
-                    replied_msg=replied_msg,
-                    exclude_chat_id=chat_id,  # Exclude current chat
-                    pin_message=("pin" in options)
-                )
-                
-            group_stats = (
-                f"\n👥 **Group Broadcast Stats**\n"
-                f"• Total groups: {total_groups}\n"
-                f"• Successful: {success}\n"
-                f"• Failed: {failed}"
+            progress = await broadcast_to_groups(
+                status_msg,
+                command,
+                text=broadcast_data.get("text"),
+                replied_msg=replied_msg,
+                exclude_chat_id=chat_id,  # Exclude current chat
+                pin_message=("pin" in options),
+                active_since=active_since,
+                spread=leg_spread,
+                album=album
             )
+            group_stats = format_broadcast_stats("👥 **Group Broadcast Stats**", progress)
+            results["groups"] = progress.summary()
             group_success = True
         except Exception as e:
             logger.error(f"Group broadcast failed: {e}")
@@ -1101,30 +1668,33 @@ async def broadcast_confirm_handler(_, query: CallbackQuery):
     user_stats = ""
     if "user" in options:
         try:
-            if broadcast_data.get("text"):
-                total_users, success, failed, status = await broadcast_to_users(
-                    query.message, 
-                    command,
-                    text=broadcast_data["text"]
-                )
-            else:
-                total_users, success, failed, status = await broadcast_to_users(
-                    query.message, 
-                    command,
-                    replied_msg=replied_msg
-                )
-                
-            user_stats = (
-                f"\n👤 **User Broadcast Stats**\n"
-                f"• Total users: {total_users}\n"
-                f"• Successful: {success}\n"
-                f"• Failed: {failed}"
+            progress = await broadcast_to_users(
+                status_msg,
+                command,
+                text=broadcast_data.get("text"),
+                replied_msg=replied_msg,
+                active_since=active_since,
+                spread=leg_spread,
+                album=album
             )
+            user_stats = format_broadcast_stats("👤 **User Broadcast Stats**", progress)
+            results["users"] = progress.summary()
             user_success = True
         except Exception as e:
             logger.error(f"User broadcast failed: {e}")
             user_stats = f"\n❌ User broadcast failed: {e}"
     
+    # Keep the final numbers for later comparison
+    if results:
+        await save_broadcast_result({
+            "broadcast_id": broadcast_id,
+            "command": command,
+            "options": options,
+            "active_days": broadcast_data.get("active_days", 0),
+            "finished_at": datetime.now(),
+            **results
+        })
+    
     # Create result message
     result_text = "✅ **Broadcast Completed**\n\n"
     if current_msg:
@@ -1155,10 +1725,64 @@ async def broadcast_confirm_handler(_, query: CallbackQuery):
                 )]
             ])
     
-    await query.message.edit_text(result_text, reply_markup=keyboard)
+    return result_text, keyboard
+
+# Callback handler for broadcast confirmation
+@app.on_callback_query(filters.regex(r"^broadcast_confirm:(\w+)$"))
+async def broadcast_confirm_handler(_, query: CallbackQuery):
+    await query.answer()
+    broadcast_id = query.data.split(":")[1]
     
-    # Clean up temporary data
-    await broadcast_collection.delete_one({"broadcast_id": broadcast_id})
+    # Get broadcast data
+    broadcast_data = await drafts.get(broadcast_id)
+    if not broadcast_data:
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, "❌ Broadcast session expired or invalid"
+        )
+        return
+    
+    schedule = broadcast_data.get("schedule", "now")
+    if schedule != "now":
+        run_at = next_run_at(broadcast_data, datetime.now())
+        await add_scheduled_broadcast({
+            "broadcast_id": broadcast_id,
+            "draft": {k: v for k, v in broadcast_data.items() if k not in ("audience", "broadcast_id")},
+            "run_at": run_at,
+            "repeat": schedule if schedule in REPEAT_INTERVALS else None,
+            "created_at": datetime.now()
+        })
+        await drafts.delete(broadcast_id)
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text,
+            f"⏰ **Broadcast Scheduled**\n\n"
+            f"• ID: `{broadcast_id}`\n"
+            f"• When: {format_schedule(schedule, broadcast_data.get('at_time'))}, first run {run_at:%Y-%m-%d %H:%M}\n"
+            f"• Spread over: {get_readable_time(int(BROADCAST_SPREAD_WINDOW))}\n\n"
+            f"Use /schedules to list or cancel."
+        )
+        return
+    
+    # Removed first, so a second tap can't start the broadcast again
+    await drafts.delete(broadcast_id)
+    
+    # Sent from a background task, so the owner's later updates don't wait
+    # behind a broadcast that can take hours
+    asyncio.create_task(
+        send_confirmed_broadcast(broadcast_id, broadcast_data, query.message),
+        name=f"broadcast:{broadcast_id}"
+    )
+
+async def send_confirmed_broadcast(broadcast_id: str, broadcast_data: dict, status_msg: Message):
+    """Run a confirmed broadcast and show the result on its menu message"""
+    try:
+        result_text, keyboard = await run_broadcast(broadcast_id, broadcast_data, status_msg)
+    except Exception as e:
+        logger.error(f"Broadcast {broadcast_id} failed: {e}")
+        result_text, keyboard = f"❌ Broadcast failed: {e}", None
+    await outbound.call(
+        status_msg.chat.id, PRIORITY_INTERACTIVE, status_msg.edit_text, result_text,
+        reply_markup=keyboard, must_send=True
+    )
 
 # Callback handler for broadcast cancellation
 @app.on_callback_query(filters.regex(r"^broadcast_cancel:(\w+)$"))
@@ -1167,16 +1791,99 @@ async def broadcast_cancel_handler(_, query: CallbackQuery):
     broadcast_id = query.data.split(":")[1]
     
     # Delete temporary data
-    await broadcast_collection.delete_one({"broadcast_id": broadcast_id})
-    await query.message.edit_text("❌ Broadcast cancelled")
+    await drafts.delete(broadcast_id)
+    await outbound.call(
+        query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, "❌ Broadcast cancelled"
+    )
+
+# Scheduled broadcasts
+async def run_scheduled_broadcast(scheduled: dict):
+    """Send one due scheduled broadcast, reporting progress to the owner"""
+    broadcast_id = scheduled["broadcast_id"]
+    try:
+        status = await outbound.call(
+            OWNER_ID, PRIORITY_INTERACTIVE, app.send_message,
+            OWNER_ID, f"⏰ Scheduled broadcast `{broadcast_id}` starting...", must_send=True
+        )
+        result_text, keyboard = await run_broadcast(
+            broadcast_id, scheduled["draft"], status, spread=BROADCAST_SPREAD_WINDOW, current_chat=False
+        )
+        await outbound.call(
+            status.chat.id, PRIORITY_INTERACTIVE, status.edit_text, result_text,
+            reply_markup=keyboard, must_send=True
+        )
+    except Exception as e:
+        logger.error(f"Scheduled broadcast {broadcast_id} failed: {e}")
+
+async def scheduled_broadcast_loop():
+    """Background task to start scheduled broadcasts when they are due"""
+    logger.info("Broadcast scheduler started")
+    while True:
+        try:
+            now = datetime.now()
+            for scheduled in await get_due_scheduled_broadcasts(now):
+                broadcast_id = scheduled["broadcast_id"]
+                interval = REPEAT_INTERVALS.get(scheduled.get("repeat"))
+                if interval:
+                    # Runs missed while the bot was down are skipped, not replayed
+                    next_run = scheduled["run_at"] + interval
+                    while next_run <= now:
+                        next_run += interval
+                    await reschedule_broadcast(broadcast_id, next_run)
+                else:
+                    await delete_scheduled_broadcast(broadcast_id)
+                asyncio.create_task(
+                    run_scheduled_broadcast(scheduled), name=f"scheduled_broadcast:{broadcast_id}"
+                )
+        except Exception as e:
+            logger.error(f"Error in broadcast scheduler: {e}")
+        await asyncio.sleep(SCHEDULE_POLL_INTERVAL)
+
+@app.on_message(filters.command("schedules") & filters.user(OWNER_ID))
+async def schedules_command(_, message: Message):
+    """List scheduled broadcasts with cancel buttons"""
+    scheduled = await get_scheduled_broadcasts()
+    if not scheduled:
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "No scheduled broadcasts"
+        )
+        return
+    
+    text = "⏰ **Scheduled Broadcasts**\n"
+    buttons = []
+    for item in scheduled:
+        draft = item["draft"]
+        preview = (draft.get("text") or "Replied content")[:40]
+        repeat = item.get("repeat") or "once"
+        text += f"\n• `{item['broadcast_id']}` {item['run_at']:%Y-%m-%d %H:%M} ({repeat}): {preview}"
+        buttons.append([InlineKeyboardButton(
+            f"❌ Cancel {item['broadcast_id']}",
+            callback_data=f"schedule_cancel:{item['broadcast_id']}"
+        )])
+    
+    await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, text, reply_markup=InlineKeyboardMarkup(buttons)
+    )
+
+@app.on_callback_query(filters.regex(r"^schedule_cancel:(\w+)$") & filters.user(OWNER_ID))
+async def schedule_cancel_handler(_, query: CallbackQuery):
+    broadcast_id = query.data.split(":")[1]
+    if await delete_scheduled_broadcast(broadcast_id):
+        await query.answer("Scheduled broadcast cancelled")
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, f"❌ Scheduled broadcast `{broadcast_id}` cancelled"
+        )
+    else:
+        await query.answer("Already sent or cancelled", show_alert=True)
 
 # Stats command
 @app.on_message(filters.command("stats"))
+@track_chat
 async def stats_command(_, message: Message):
     uptime = get_readable_time(int(time.time() - BOT_START_TIME))
-    total_users = await users_collection.count_documents({})
-    afk_users = await afk_collection.count_documents({})
-    total_groups = await groups_collection.count_documents({})
+    total_users = await count_users()
+    afk_users = await count_afk_users()
+    total_groups = await count_groups()
     
     stats_text = (
         f"🤖 **Bot Statistics**\n"
@@ -1186,11 +1893,112 @@ async def stats_command(_, message: Message):
         f"• Groups Added: `{total_groups}`"
     )
     
-    sent_msg = await message.reply_text(stats_text)
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, stats_text
+    )
     await track_message_for_deletion(sent_msg)
 
+# Heaviest groups from the hourly activity buckets
+@app.on_message(filters.command("topgroups") & filters.user(OWNER_ID))
+async def top_groups_command(_, message: Message):
+    """Show the busiest groups: /topgroups [count] [hours] [field]"""
+    args = message.command[1:]
+    try:
+        limit = min(int(args[0]), 50) if len(args) > 0 else 10
+        hours = int(args[1]) if len(args) > 1 else 24
+    except ValueError:
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "Usage: /topgroups [count] [hours] [messages|afk_notices|mentions|db_ops|api_calls]"
+        )
+        return
+    field = args[2] if len(args) > 2 else "messages"
+    if field not in TOP_GROUP_FIELDS:
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"Unknown field, use one of: {', '.join(TOP_GROUP_FIELDS)}"
+        )
+        return
+    
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    top = await get_top_groups(since, limit, field)
+    if not top:
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "No group activity recorded yet"
+        )
+        return
+    
+    lines = [f"📊 **Top {len(top)} groups by {field}, last {hours}h**\n"]
+    for rank, row in enumerate(top, 1):
+        lines.append(
+            f"{rank}. {row['title'] or row['chat_id']} (`{row['chat_id']}`)\n"
+            f"   msgs {row['messages']} | notices {row['afk_notices']} | mentions {row['mentions']} | "
+            f"db {row['db_ops']} | api {row['api_calls']}"
+        )
+    await outbound.call(message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "\n".join(lines))
+
+# Owner diagnostics
+@app.on_message(filters.command("profile") & filters.user(OWNER_ID))
+async def profile_command(_, message: Message):
+    """Profile the event loop for N seconds and reply with the report"""
+    if diagnostics.profile_running():
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "A profile is already running"
+        )
+        return
+    
+    try:
+        seconds = int(message.command[1]) if len(message.command) > 1 else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"Usage: /profile [seconds, max {PROFILE_MAX_SECONDS}]"
+        )
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    
+    status = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"⏱ Profiling the event loop for {seconds}s...",
+        must_send=True
+    )
+    # Profiled in the background, so this handler doesn't hold a worker, or
+    # the owner's later updates, for the whole run
+    asyncio.create_task(send_profile(message, status, seconds), name=f"profile:{message.id}")
+
+async def send_profile(message: Message, status: Message, seconds: int):
+    """Profile the event loop, then reply with the report and remove the status"""
+    try:
+        report = await diagnostics.profile_loop(seconds)
+    except Exception as e:
+        logger.error(f"Event loop profile failed: {e}")
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, f"❌ Profile failed: {e}",
+            must_send=True
+        )
+        return
+    
+    document = io.BytesIO(report.encode())
+    document.name = f"profile-{int(time.time())}.txt"
+    await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE,
+        message.reply_document, document, caption=f"Event loop profile ({seconds}s)",
+        must_send=True
+    )
+    if status:
+        await outbound.call(status.chat.id, PRIORITY_DELETION, status.delete)
+
+@app.on_message(filters.command("tasks") & filters.user(OWNER_ID))
+async def tasks_command(_, message: Message):
+    """Reply with every live asyncio task and its stack"""
+    report = diagnostics.dump_tasks()
+    
+    document = io.BytesIO(report.encode())
+    document.name = f"tasks-{int(time.time())}.txt"
+    await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE,
+        message.reply_document, document, caption=f"{len(asyncio.all_tasks())} live tasks"
+    )
+
 # Auto-delete menu command (inline buttons) - Per Group Settings
 @app.on_message(filters.command(["autodel", "autodelete"]) & filters.group)
+@track_chat
 async def auto_delete_menu(_, message: Message):
     """Show auto-delete settings menu for this group"""
     chat_id = message.chat.id
@@ -1200,20 +2008,27 @@ async def auto_delete_menu(_, message: Message):
     try:
         member = await app.get_chat_member(chat_id, message.from_user.id)
         if member.status not in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]:
-            await message.reply_text("❌ You must be an admin to configure auto-delete settings")
+            await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "❌ You must be an admin to configure auto-delete settings"
+            )
             return
     except Exception as e:
         logger.error(f"Admin check error: {e}")
-        await message.reply_text("❌ Failed to verify admin status")
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "❌ Failed to verify admin status"
+        )
         return
     
     text, keyboard = await get_auto_delete_menu(chat_id)
     
-    sent_msg = await message.reply_text(text, reply_markup=keyboard)
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, text, reply_markup=keyboard
+    )
     await track_message_for_deletion(sent_msg)
 
 # Auto-delete callback handler - FIXED VERSION
 @app.on_callback_query(filters.regex(r"^autodel_"))
+@track_chat
 async def auto_delete_callback(_, query: CallbackQuery):
     """Handle auto-delete callback actions with group-specific settings"""
     try:
@@ -1255,7 +2070,8 @@ async def auto_delete_callback(_, query: CallbackQuery):
                 "Use the buttons below to manage settings:"
             )
             
-            await query.message.edit_text(
+            await outbound.call(
+                query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text,
                 text,
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("🔙 Back to Menu", callback_data=f"autodel_back:{chat_id}")],
@@ -1265,7 +2081,8 @@ async def auto_delete_callback(_, query: CallbackQuery):
         
         elif action == "disable":
             await toggle_auto_delete(chat_id, False)
-            await query.message.edit_text(
+            await outbound.call(
+                query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text,
                 "❌ Auto-delete has been disabled for this group\n\n"
                 "Bot messages in this group will no longer be automatically deleted.",
                 reply_markup=InlineKeyboardMarkup([
@@ -1278,7 +2095,8 @@ async def auto_delete_callback(_, query: CallbackQuery):
             minutes = seconds // 60
             await set_auto_delete_time(chat_id, seconds)
             await toggle_auto_delete(chat_id, True)
-            await query.message.edit_text(
+            await outbound.call(
+                query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text,
                 f"✅ Auto-delete time set to {minutes} minutes and enabled for this group",
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("🔙 Back to Menu", callback_data=f"autodel_back:{chat_id}")],
@@ -1287,38 +2105,209 @@ async def auto_delete_callback(_, query: CallbackQuery):
             )
         
         elif action == "close":
-            await query.message.delete()
+            await outbound.call(query.message.chat.id, PRIORITY_DELETION, query.message.delete)
         
         elif action == "back":
             # Re-show the menu for this group
             text, keyboard = await get_auto_delete_menu(chat_id)
-            await query.message.edit_text(text, reply_markup=keyboard)
+            await outbound.call(
+                query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, text, reply_markup=keyboard
+            )
     
     except Exception as e:
         logger.error(f"Error in auto-delete callback: {e}")
         await query.answer("An error occurred. Please try again.", show_alert=True)
 
+# Watcher feature gates menu
+FEATURE_LABELS = {
+    "mention_notices": "Mention notices",
+    "reply_notices": "Reply notices",
+    "back_online_notices": "Back online notices",
+    "text_only": "Media AFK as text only",
+}
+
+async def get_features_menu(chat_id: int):
+    features = await get_chat_features(chat_id)
+    
+    lines = [
+        f"• {label}: {'🟢 On' if features[name] else '🔴 Off'}"
+        for name, label in FEATURE_LABELS.items()
+    ]
+    text = (
+        "⚙️ **AFK Features for This Group**\n\n"
+        + "\n".join(lines)
+        + "\n\nTap a feature to switch it:"
+    )
+    
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            f"{'🟢' if features[name] else '🔴'} {label}",
+            callback_data=f"features_toggle:{name}:{chat_id}"
+        )]
+        for name, label in FEATURE_LABELS.items()
+    ] + [
+        [InlineKeyboardButton("❌ Close", callback_data=f"features_close:{chat_id}")]
+    ])
+    
+    return text, keyboard
+
+@app.on_message(filters.command("features") & filters.group)
+@track_chat
+async def features_menu(_, message: Message):
+    """Show the watcher feature gates menu for this group"""
+    chat_id = message.chat.id
+    
+    # Check if user is admin
+    try:
+        member = await app.get_chat_member(chat_id, message.from_user.id)
+        if member.status not in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]:
+            await outbound.call(
+                message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "❌ You must be an admin to configure AFK features"
+            )
+            return
+    except Exception as e:
+        logger.error(f"Admin check error: {e}")
+        await outbound.call(
+            message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, "❌ Failed to verify admin status"
+        )
+        return
+    
+    text, keyboard = await get_features_menu(chat_id)
+    
+    sent_msg = await outbound.call(
+        message.chat.id, PRIORITY_INTERACTIVE, message.reply_text, text, reply_markup=keyboard
+    )
+    await track_message_for_deletion(sent_msg)
+
+@app.on_callback_query(filters.regex(r"^features_"))
+@track_chat
+async def features_callback(_, query: CallbackQuery):
+    """Switch a feature gate from the menu"""
+    try:
+        # Format: "features_toggle:name:chat_id" or "features_close:chat_id"
+        parts = query.data.split(':')
+        action = parts[0].replace("features_", "")
+        chat_id = int(parts[-1])
+        
+        # Check if user is admin in this group
+        try:
+            member = await app.get_chat_member(chat_id, query.from_user.id)
+            if member.status not in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]:
+                await query.answer("❌ You must be an admin to use this", show_alert=True)
+                return
+        except Exception as e:
+            logger.error(f"Admin check error: {e}")
+            await query.answer("❌ Permission check failed", show_alert=True)
+            return
+        
+        if action == "close":
+            await query.answer()
+            await outbound.call(query.message.chat.id, PRIORITY_DELETION, query.message.delete)
+            return
+        
+        name = parts[1]
+        if name not in CHAT_FEATURE_DEFAULTS:
+            await query.answer("Unknown feature", show_alert=True)
+            return
+        features = await get_chat_features(chat_id)
+        await set_chat_feature(chat_id, name, not features[name])
+        await query.answer(f"{FEATURE_LABELS[name]} {'off' if features[name] else 'on'}")
+        
+        text, keyboard = await get_features_menu(chat_id)
+        await outbound.call(
+            query.message.chat.id, PRIORITY_INTERACTIVE, query.message.edit_text, text, reply_markup=keyboard
+        )
+    
+    except Exception as e:
+        logger.error(f"Error in features callback: {e}")
+        await query.answer("An error occurred. Please try again.", show_alert=True)
+
 # Main execution
 async def main():
     # Create downloads directory if not exists
     os.makedirs("downloads", exist_ok=True)
     logger.info("Created downloads directory")
     
-    # Start auto-delete background task
-    asyncio.create_task(auto_delete_loop())
+    # Start event loop lag monitor
+    asyncio.create_task(loop_lag_loop(), name="loop_lag_loop")
     
     # Start Flask server in a separate thread
     flask_thread = threading.Thread(target=run_flask, daemon=True)
     flask_thread.start()
     logger.info(f"Flask server started on port {PORT}")
     
-    # Start the Telegram bot
-    await app.start()
-    logger.info("Telegram bot is now running...")
+    # Start every bot in its own task, so each runs in its own namespace and
+    # a revoked token only stops its own bot
+    results = await asyncio.gather(*(run_bot(bot) for bot in bots.values()), return_exceptions=True)
+    for bot, result in zip(bots.values(), results):
+        if isinstance(result, BaseException):
+            logger.error(f"Telegram bot {bot.name} failed to start: {result}")
+    if not any(bot.is_connected for bot in bots.values()):
+        raise RuntimeError("No bot could be started")
     
-    # Keep the bot running
+    # Keep the bots running
     await idle()
 
+async def run_bot(bot: Bot):
+    """Start one bot and its background tasks"""
+    # Inherited by the tasks below and by the handler workers start() creates
+    current_namespace.set(bot.namespace)
+    suffix = f":{bot.namespace}" if bot.namespace else ""
+    
+    # Answer from the last snapshot until MongoDB has been re-read below
+    load_hot_state()
+    
+    # Extra bots answer with the handlers registered on the main one
+    if bot is not bots[""]:
+        for handler, group in bots[""].registered_handlers:
+            bot.add_handler(handler, group)
+    
+    # Start the Telegram bot
+    await bot.start()
+    logger.info(f"Telegram bot {bot.name} is now running...")
+    
+    # Background tasks only start once the bot is up, so a bot that failed to
+    # start leaves its database alone. Database setup runs in the background,
+    # so a MongoDB outage doesn't stop the boot
+    asyncio.create_task(database_setup_loop(), name=f"database_setup_loop{suffix}")
+    
+    # Start auto-delete background task
+    asyncio.create_task(auto_delete_loop(), name=f"auto_delete_loop{suffix}")
+    
+    # Start session sync background task
+    asyncio.create_task(session_sync_loop(), name=f"session_sync_loop{suffix}")
+    
+    # Start retention background task
+    asyncio.create_task(retention_loop(), name=f"retention_loop{suffix}")
+    
+    # Start broadcast scheduler background task
+    asyncio.create_task(scheduled_broadcast_loop(), name=f"scheduled_broadcast_loop{suffix}")
+    
+    # Start AFK index background task
+    asyncio.create_task(afk_index_loop(), name=f"afk_index_loop{suffix}")
+    
+    # Start group activity flush background task
+    asyncio.create_task(analytics_flush_loop(), name=f"analytics_flush_loop{suffix}")
+    
+    # Start seen users and groups flush background task
+    asyncio.create_task(seen_flush_loop(), name=f"seen_flush_loop{suffix}")
+    
+    # Start journal replay background task
+    asyncio.create_task(journal_replay_loop(), name=f"journal_replay_loop{suffix}")
+    
+    # Start warm-start snapshot background task
+    asyncio.create_task(snapshot_loop(), name=f"snapshot_loop{suffix}")
+
+async def flush_bot_writes(bot: Bot):
+    """Write what one bot still holds in memory before the process exits"""
+    current_namespace.set(bot.namespace)
+    for name, flush in (("users", flush_seen_users), ("groups", flush_seen_groups)):
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"Error flushing seen {name} of {bot.name}: {e}")
+    await flush_journal()
+
 if __name__ == "__main__":
     try:
         loop = asyncio.get_event_loop()
@@ -1328,5 +2317,19 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Fatal error: {e}")
     finally:
-        loop.run_until_complete(app.stop())
+        loop.run_until_complete(asyncio.gather(
+            *(bot.stop() for bot in bots.values() if bot.is_connected)
+        ))
+        # Keep the user activity and journaled writes still buffered in memory
+        loop.run_until_complete(asyncio.gather(
+            *(flush_bot_writes(bot) for bot in bots.values())
+        ))
+        # Save the state the next start will warm up from
+        try:
+            # Only bots that ran have state worth keeping
+            loop.run_until_complete(asyncio.gather(
+                *(save_hot_state(namespace) for namespace, bot in bots.items() if bot.me)
+            ))
+        except Exception as e:
+            logger.error(f"Error saving warm-start snapshot: {e}")
         logger.info("Bot stopped")
\ No newline at end of file
@@ -0,0 +1,46 @@
+import threading
+from collections import defaultdict
+
+# Process-wide counters and gauges, exposed on the health server at /metrics
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def inc(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float, buckets):
+    """Add `value` to a cumulative histogram: `name_le_<bucket>`, `name_count`, `name_sum`"""
+    with _lock:
+        for bucket in buckets:
+            if value <= bucket:
+                _counters[f"{name}_le_{bucket}"] += 1
+        _counters[f"{name}_count"] += 1
+        _counters[f"{name}_sum"] += value
+
+
+def get(name: str, default=0):
+    with _lock:
+        if name in _gauges:
+            return _gauges[name]
+        return _counters.get(name, default)
+
+
+def snapshot() -> dict:
+    with _lock:
+        data = dict(_counters)
+        data.update(_gauges)
+    return data
+
+
+def render() -> str:
+    """Plain-text `name value` lines, sorted by name"""
+    return "\n".join(f"{name} {value}" for name, value in sorted(snapshot().items())) + "\n"
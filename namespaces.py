@@ -0,0 +1,32 @@
+from contextvars import ContextVar
+
+# Namespace of the bot whose update or background task is running; "" is the
+# bot from BOT_TOKEN, which keeps the original database
+current_namespace = ContextVar("bot_namespace", default="")
+
+
+class PerNamespace:
+    """Stands in for one `factory(namespace)` object per bot, created on first use.
+
+    Attribute access goes to the object for the current namespace, so module
+    level names like `afk_collection` or `app` keep working unchanged when
+    several bots share the process.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+
+    def for_namespace(self, namespace: str = None):
+        if namespace is None:
+            namespace = current_namespace.get()
+        instance = self._instances.get(namespace)
+        if instance is None:
+            instance = self._instances[namespace] = self._factory(namespace)
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.for_namespace(), name)
+
+    def __contains__(self, item) -> bool:
+        return item in self.for_namespace()
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from pyrogram.errors import FloodWait
+
+import analytics
+import metrics
+from namespaces import PerNamespace
+from config import (
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GROUP_RATE,
+    OUTBOUND_GROUP_BURST,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_PRIVATE_BURST,
+    OUTBOUND_DELETION_RATE,
+    OUTBOUND_DELETION_BURST,
+    OUTBOUND_MAX_FLOOD_RETRIES,
+    OUTBOUND_INTERACTIVE_MAX_WAIT,
+    OUTBOUND_INTERACTIVE_TOKEN_WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Lower value wins: replies to users beat broadcasts, which beat cleanup
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BROADCAST = 1
+PRIORITY_DELETION = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BROADCAST: "broadcast",
+    PRIORITY_DELETION: "deletion",
+}
+
+
+class PriorityRateLimiter:
+    """Token bucket whose waiters are served by priority, then arrival order"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []  # heap of (priority, seq, future)
+        self.seq = itertools.count()
+        self.pump_task = None
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _delay(self, now: float) -> float:
+        """Seconds until a token can be taken"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return not self.waiters and now >= self.paused_until and self._delay(now) == 0 and self.tokens >= self.burst
+
+    def release(self):
+        """Give back a token that was taken but not used"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`, e.g. after a FloodWait"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int):
+        if not self.waiters and self._delay(time.monotonic()) == 0:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), future))
+        if self.pump_task is None or self.pump_task.done():
+            self.pump_task = asyncio.create_task(self._pump())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled right after the pump handed this waiter its token
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    async def _pump(self):
+        while self.waiters:
+            # Skip waiters that were cancelled while queued
+            if self.waiters[0][2].done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = self._delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self.tokens -= 1
+            _, _, future = heapq.heappop(self.waiters)
+            future.set_result(None)
+
+
+class OutboundScheduler:
+    """Single gate for every outgoing Telegram call.
+
+    Each call waits for a per-chat token (group or private rate) and then a
+    global token, in priority order, and FloodWait is handled here by pausing
+    the affected chat and retrying. Deletions have their own per-chat bucket,
+    so cleanup isn't starved by replies in busy groups.
+    """
+
+    def __init__(self):
+        self.global_limiter = PriorityRateLimiter(OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST)
+        self.chat_limiters = {}
+        self.deletion_limiters = {}
+
+    def _chat_limiter(self, chat_id: int, priority: int) -> PriorityRateLimiter:
+        limiters = self.deletion_limiters if priority == PRIORITY_DELETION else self.chat_limiters
+        limiter = limiters.get(chat_id)
+        if limiter is None:
+            if len(limiters) > 10_000:
+                self._prune(limiters)
+            if priority == PRIORITY_DELETION:
+                limiter = PriorityRateLimiter(OUTBOUND_DELETION_RATE, OUTBOUND_DELETION_BURST)
+            elif chat_id < 0:
+                limiter = PriorityRateLimiter(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST)
+            else:
+                limiter = PriorityRateLimiter(OUTBOUND_PRIVATE_RATE, OUTBOUND_PRIVATE_BURST)
+            limiters[chat_id] = limiter
+        return limiter
+
+    @staticmethod
+    def _prune(limiters: dict):
+        for chat_id in [c for c, limiter in limiters.items() if limiter.idle]:
+            del limiters[chat_id]
+
+    async def _acquire(self, chat_limiter: PriorityRateLimiter, priority: int):
+        await chat_limiter.acquire(priority)
+        try:
+            await self.global_limiter.acquire(priority)
+        except asyncio.CancelledError:
+            # Timed out waiting for the global token: the chat token wasn't used
+            chat_limiter.release()
+            raise
+
+    async def call(self, chat_id: int, priority: int, func, /, *args, on_flood_wait=None, must_send=False, **kwargs):
+        """Run `func(*args, **kwargs)` for `chat_id` once rate limits allow.
+
+        Interactive calls that can't get a token within
+        OUTBOUND_INTERACTIVE_TOKEN_WAIT are dropped and return None, unless
+        `must_send` is set.
+        """
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        chat_limiter = self._chat_limiter(chat_id, priority)
+        token_wait = None
+        if priority == PRIORITY_INTERACTIVE and not must_send and OUTBOUND_INTERACTIVE_TOKEN_WAIT:
+            token_wait = OUTBOUND_INTERACTIVE_TOKEN_WAIT
+
+        for attempt in range(OUTBOUND_MAX_FLOOD_RETRIES + 1):
+            queued = time.monotonic()
+            try:
+                await asyncio.wait_for(self._acquire(chat_limiter, priority), token_wait)
+            except asyncio.TimeoutError:
+                # A late reply is worse than none, and waiting holds a handler worker
+                metrics.inc(f"outbound_{name}_dropped")
+                logger.debug(f"Dropped {name} call to chat {chat_id} after {token_wait}s without a token")
+                return None
+            metrics.inc(f"outbound_{name}_wait_ms", int((time.monotonic() - queued) * 1000))
+
+            analytics.record_current(api_calls=1)
+            try:
+                result = await func(*args, **kwargs)
+                metrics.inc(f"outbound_{name}_calls")
+                return result
+            except FloodWait as e:
+                metrics.inc(f"outbound_{name}_flood_waits")
+                metrics.inc("outbound_flood_wait_seconds", e.value)
+                logger.warning(f"FloodWait {e.value}s in chat {chat_id} ({name})")
+                chat_limiter.pause(e.value)
+                if on_flood_wait:
+                    on_flood_wait(e.value)
+                # A late AFK reply is worse than none
+                if priority == PRIORITY_INTERACTIVE and e.value > OUTBOUND_INTERACTIVE_MAX_WAIT:
+                    raise
+                if attempt == OUTBOUND_MAX_FLOOD_RETRIES:
+                    raise
+
+
+# Telegram's limits apply per bot token, so each hosted bot gets its own
+outbound = PerNamespace(lambda namespace: OutboundScheduler())
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning MongoDB is unreachable or too slow, as opposed to a bad query
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError)
+
+
+class DatabaseUnavailable(Exception):
+    """MongoDB is unreachable or the circuit is open"""
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stop calling MongoDB after repeated failures, then probe with one call"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # Let one caller through to test the connection; if it never
+            # reports back, another gets a turn after the next timeout
+            self.opened_at = now
+            self._set_state(HALF_OPEN)
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            logger.info("MongoDB reachable again, closing circuit")
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"MongoDB failing ({self.failures} errors), opening circuit")
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.set_gauge("db_circuit_state", _STATE_GAUGE[state])
+
+
+class LRUCache:
+    """Bounded mapping used to answer reads while MongoDB is down"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.data = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+
+class WriteJournal:
+    """Local SQLite log of writes that could not reach MongoDB.
+
+    Each row is keyed by the entity it updates, so repeated writes to the same
+    user or group replace the older row and move it to the end of the log.
+    Appends are buffered in memory and committed in batches from a dedicated
+    thread, so the event loop never waits on the disk. The file is only
+    created on the first flush.
+    """
+
+    def __init__(self, path: str, flush_size: int = 500):
+        self.path = Path(path)
+        self.flush_size = flush_size
+        self._conn = None
+        self._buffer = OrderedDict()  # key -> (op, args) not yet in SQLite
+        self._flush_lock = asyncio.Lock()
+        # One thread owns the connection, so batches never interleave
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        # Writes must queue behind unreplayed rows to keep their order
+        self.pending = self.path.is_file() and self._count() > 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, op TEXT, args TEXT)"
+            )
+        return self._conn
+
+    def append(self, key: str, op: str, args: dict):
+        self._buffer[key] = (op, json.dumps(args, default=str))
+        self._buffer.move_to_end(key)
+        self.pending = True
+        metrics.inc("db_writes_journaled")
+        if len(self._buffer) >= self.flush_size and not self._flush_lock.locked():
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def flush(self):
+        """Commit the buffered appends to SQLite in one transaction"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, OrderedDict()
+            try:
+                await self._run(self._insert, [(key, op, args) for key, (op, args) in rows.items()])
+            except Exception as e:
+                logger.error(f"Error writing {len(rows)} journaled writes to {self.path}: {e}")
+                # Keep them for the next flush, behind nothing newer for the same key
+                for key, row in reversed(rows.items()):
+                    if key not in self._buffer:
+                        self._buffer[key] = row
+                        self._buffer.move_to_end(key, last=False)
+                return
+            metrics.inc("db_journal_flushes")
+
+    def _insert(self, rows):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT OR REPLACE INTO journal (key, op, args) VALUES (?, ?, ?)", rows)
+
+    def _count(self) -> int:
+        if self._conn is None and not self.path.is_file():
+            return 0
+        return self.conn.execute("SELECT COUNT(*) FROM journal").fetchone()[0]
+
+    async def size(self) -> int:
+        """Rows in SQLite plus appends not flushed yet"""
+        return await self._run(self._count) + len(self._buffer)
+
+    async def read(self, limit: int):
+        """Oldest `limit` rows as (id, op, args), flushing buffered appends first"""
+        await self.flush()
+        rows = await self._run(self._select, limit)
+        return [(row_id, op, json.loads(args)) for row_id, op, args in rows]
+
+    def _select(self, limit: int):
+        if self._conn is None and not self.path.is_file():
+            return []
+        return self.conn.execute(
+            "SELECT id, op, args FROM journal ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+
+    async def remove(self, ids):
+        # Rows rewritten during a replay got a new id and are kept
+        remaining = await self._run(self._delete, ids)
+        self.pending = remaining > 0 or bool(self._buffer)
+
+    def _delete(self, ids) -> int:
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM journal WHERE id = ?", [(row_id,) for row_id in ids])
+        return self._count()
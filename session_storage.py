@@ -0,0 +1,104 @@
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from pyrogram.storage import FileStorage, MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# MongoDB documents are capped at 16 MB, keep some headroom
+MAX_MIRROR_SIZE = 15 * 1024 * 1024
+
+
+class MongoMirroredStorage(FileStorage):
+    """Pyrogram SQLite session file mirrored to a MongoDB document.
+
+    The local file is used as the working copy. When it is missing (fresh
+    container after a redeploy) it is restored from MongoDB before Pyrogram
+    opens it, so the auth key and peer cache survive restarts.
+    """
+
+    def __init__(self, name: str, workdir: Path, collection):
+        super().__init__(name, workdir)
+        self.collection = collection
+        self._last_digest = None
+
+    async def open(self):
+        if not self.database.is_file():
+            await self.restore()
+        await super().open()
+
+    async def save(self):
+        await super().save()
+        await self.mirror()
+
+    async def close(self):
+        self.conn.commit()
+        await self.mirror()
+        await super().close()
+
+    async def delete(self):
+        await super().delete()
+        await self.collection.delete_one({"_id": self.name})
+
+    async def restore(self):
+        """Write the mirrored session from MongoDB to the local file"""
+        try:
+            doc = await self.collection.find_one({"_id": self.name}, {"data": 1})
+        except Exception as e:
+            logger.error(f"Session restore failed: {e}")
+            return
+
+        if not doc or not doc.get("data"):
+            logger.info(f"No mirrored session found for {self.name}")
+            return
+
+        data = bytes(doc["data"])
+        self.database.parent.mkdir(parents=True, exist_ok=True)
+        self.database.write_bytes(data)
+        self._last_digest = hashlib.sha1(data).digest()
+        logger.info(f"Restored session {self.name} from MongoDB ({len(data)} bytes)")
+
+    async def mirror(self):
+        """Upload the local session file to MongoDB if it changed"""
+        try:
+            data = self.database.read_bytes()
+        except OSError as e:
+            logger.error(f"Session mirror failed: {e}")
+            return
+
+        digest = hashlib.sha1(data).digest()
+        if digest == self._last_digest:
+            return
+
+        if len(data) > MAX_MIRROR_SIZE:
+            logger.warning(f"Session file too large to mirror ({len(data)} bytes)")
+            return
+
+        try:
+            await self.collection.update_one(
+                {"_id": self.name},
+                {"$set": {"data": data, "updated_at": datetime.now()}},
+                upsert=True
+            )
+            self._last_digest = digest
+            logger.debug(f"Mirrored session {self.name} to MongoDB ({len(data)} bytes)")
+        except Exception as e:
+            logger.error(f"Session mirror failed: {e}")
+
+
+def make_storage(kind: str, name: str, workdir: str, collection=None):
+    """Build the session storage selected by SESSION_STORAGE"""
+    if kind == "memory":
+        return MemoryStorage(name)
+
+    path = Path(workdir)
+    path.mkdir(parents=True, exist_ok=True)
+
+    if kind == "file":
+        return FileStorage(name, path)
+    if kind == "mongo":
+        return MongoMirroredStorage(name, path, collection)
+
+    raise ValueError(f"Unknown session storage: {kind}")
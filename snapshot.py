@@ -0,0 +1,45 @@
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the saved state changes; older files are ignored
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path: str, state: dict):
+    """Write `state` to `path`, replacing the previous snapshot atomically"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(
+            {"version": SNAPSHOT_VERSION, "saved_at": time.time(), "state": state},
+            f, protocol=pickle.HIGHEST_PROTOCOL
+        )
+    os.replace(tmp, path)
+
+
+def read_snapshot(path: str, max_age: float):
+    """State saved by `write_snapshot`, or None if missing, outdated or unreadable"""
+    path = Path(path)
+    if not path.is_file():
+        return None
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        logger.info(f"Ignoring snapshot {path} from another version")
+        return None
+    age = time.time() - data["saved_at"]
+    if max_age and age > max_age:
+        logger.info(f"Ignoring snapshot {path}, {age:.0f}s old")
+        return None
+    return data["state"]
@@ -0,0 +1,75 @@
+import asyncio
+from collections import deque
+
+from pyrogram import raw, utils
+
+import metrics
+
+
+def update_key(update, mode: str):
+    """User ("user" mode) or chat ("chat" mode) a raw update belongs to, if any"""
+    message = getattr(update, "message", None)
+    if message is not None and hasattr(message, "peer_id"):
+        from_id = getattr(message, "from_id", None)
+        if mode == "user" and isinstance(from_id, raw.types.PeerUser):
+            return from_id.user_id
+        # Private chats have no from_id: the peer is the user
+        return utils.get_peer_id(message.peer_id)
+    if mode == "chat" and getattr(update, "peer", None) is not None:
+        return utils.get_peer_id(update.peer)
+    # Callback and inline queries
+    return getattr(update, "user_id", None)
+
+
+class OrderedUpdateQueue:
+    """Drop-in for Pyrogram's dispatcher queue that serializes updates per key.
+
+    Updates sharing a key are handed to workers one at a time, in arrival
+    order; the others run in parallel across all workers. A worker's key is
+    released when it asks for its next update, which Pyrogram's workers only
+    do once every handler group has finished with the previous one. Updates
+    held back behind a busy key don't occupy a worker.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.ready = asyncio.Queue()  # (key, packet) that may run now
+        self.held = {}  # key -> packets waiting for the one in progress
+        self.held_count = 0
+        self.running = {}  # worker task -> key it is handling
+
+    def qsize(self) -> int:
+        return self.ready.qsize() + self.held_count
+
+    def put_nowait(self, packet):
+        # None tells a worker to stop
+        key = None if packet is None else update_key(packet[0], self.mode)
+        if key is None:
+            self.ready.put_nowait((None, packet))
+        elif key in self.held:
+            self.held[key].append(packet)
+            self.held_count += 1
+            metrics.inc("updates_held")
+        else:
+            self.held[key] = deque()
+            self.ready.put_nowait((key, packet))
+
+    def _release(self, key):
+        waiting = self.held[key]
+        if waiting:
+            # Goes behind other keys' updates, so a busy chat can't starve them
+            self.held_count -= 1
+            self.ready.put_nowait((key, waiting.popleft()))
+        else:
+            del self.held[key]
+
+    async def get(self):
+        task = asyncio.current_task()
+        previous = self.running.pop(task, None)
+        if previous is not None:
+            self._release(previous)
+
+        key, packet = await self.ready.get()
+        if key is not None:
+            self.running[task] = key
+        return packet